@@ -0,0 +1,104 @@
+import contextvars
+from pathlib import Path
+
+import pyotp
+from dotenv import dotenv_values
+
+logger = None
+
+
+class Account:
+    """One affiliate account: its credentials, its files and its per-account singletons."""
+
+    def __init__(self, name: str, config: dict, path: Path) -> None:
+        self.name = name
+        self.config = config
+        self.path = path
+        self.email = config["email"]
+        self.password = config["password"]
+        self.google_auth_secret_key = config.get("google_auth_secret_key")
+
+        self.cookies_path = path.joinpath("cookies.json")
+        self.messages_path = path.joinpath("messages.txt")
+        self.chat_ids_path = path.joinpath("chat_ids.txt")
+        self.withdrawal_message_path = path.joinpath("last_withdrawal_message.txt")
+        self.state_path = path.joinpath("state.db")
+
+        self.instances: dict = {}
+
+    def __repr__(self) -> str:
+        return "Account(%s)" % self.name
+
+    def get_auth_code(self) -> str:
+        if self.google_auth_secret_key:
+            return pyotp.TOTP(self.google_auth_secret_key).now()
+
+    def instance(self, name: str, factory):
+        if name not in self.instances:
+            self.instances[name] = factory(self)
+        return self.instances[name]
+
+
+# Set by core.py from credentials.env, used whenever no account is active
+default: Account = None
+
+current_account: contextvars.ContextVar[Account] = contextvars.ContextVar("current_account", default=None)
+
+
+def current() -> Account:
+    return current_account.get() or default
+
+
+def activate(account: Account) -> contextvars.Token:
+    return current_account.set(account)
+
+
+class Scoped:
+    """
+    Module level singleton that is actually one instance per account.
+    Attribute access is forwarded to the instance of the active account.
+    """
+
+    def __init__(self, name: str, factory) -> None:
+        self._name = name
+        self._factory = factory
+
+    def instance(self):
+        # Not called `get`, that would shadow the `get` of the wrapped objects
+        return current().instance(self._name, self._factory)
+
+    def __getattr__(self, attr: str):
+        return getattr(self.instance(), attr)
+
+
+def load_accounts(accounts_path: Path, base_config: dict) -> list[Account]:
+    """
+    Every `accounts/<name>/credentials.env` is one account, its values
+    override the root credentials.env. Without any, the root account runs alone.
+    """
+    loaded = []
+    if accounts_path.is_dir():
+        for path in sorted(accounts_path.iterdir()):
+            credentials_path = path.joinpath("credentials.env")
+            if not credentials_path.is_file():
+                continue
+            try:
+                config = {**base_config, **dotenv_values(credentials_path.as_posix())}
+                loaded.append(Account(path.name, config, path))
+            except Exception as e:
+                logger.exception("ERR_LOAD_ACCOUNT: %s | %s" % (path.name, e))
+    return loaded or [default]
+
+
+def for_chat(accounts: list[Account], chat_id: int | str, chat_ids_of) -> Account:
+    # The first account alerting this chat, the first account otherwise
+    for account in accounts:
+        if str(chat_id) in (chat_ids_of(account) or []):
+            return account
+    return accounts[0]
+
+
+async def run_as(account: Account, func, *args, **kwargs):
+    # Runs inside its own task, the context change stays local to it
+    activate(account)
+    return await func(*args, **kwargs)
@@ -1,5 +1,7 @@
 import requests
 
+import records
+
 logger = None
 
 
@@ -139,6 +141,111 @@ def formatted_message_current(value_type: str, *args) -> str:
         return mapped_lines[0] % args[2]
 
 
+# Order the money figures are rendered in
+ALERT_FIGURES = ["balance", "deposits", "withdrawals", "commission", "bonus"]
+
+
+def format_significant_change(stats: records.StatsDelta, figures: list[str]) -> str:
+    # Only the figures that moved past their threshold, against the last alert
+    return "\n\n".join([
+        "⚡️ *Significant change*",
+        *(
+            "\n".join(mapping[name][:2]) % (
+                "{:,.2f} ({})".format(getattr(stats.current, name), format_currency(getattr(stats.change, name))),
+                "{:,.2f}".format(float(getattr(stats.old, name))),
+            )
+            for name in ALERT_FIGURES if name in figures
+        ),
+        "👤 Account Email: %s" % stats.account_email,
+    ])
+
+
+def format_ranking(stats: records.StatsDelta) -> str:
+    return "\n\n🏆 *Ranking*\n🎖 Position: %s\n💵 Sum of deposits: %s\n\n⚙️ Account Status: %s\n👤 Account Email: %s\n🆔 Account ID: %s" % (stats.rank, stats.deposits_sum, stats.account_status, stats.account_email, stats.account_id)
+
+
+def format_only_change(stats: records.StatsDelta, period: str) -> str:
+    final_message = None
+    # if stats.change.hold:
+    
+    final_message = "\n\n".join([
+        message.strip()
+        for message in [
+            formatted_message(name, *stats.money(name))
+            for name in ALERT_FIGURES
+        ]
+        if message and message.strip()
+    ])
+
+    # if final_message:
+    final_message += "\n\n" + formatted_message("bottom", *stats.activity())
+    final_message += format_ranking(stats)
+
+    return final_message
+
+
+def format_even_no_change(stats: records.StatsDelta, period: str) -> str:
+    final_message = "\n\n".join([
+        message.strip()
+        for message in [
+                formatted_message_even_no_change(name, *stats.money(name))
+                for name in ALERT_FIGURES
+            ]
+            if message and message.strip()
+    ])
+
+    if final_message:
+        final_message += "\n\n" + formatted_message_even_no_change("bottom", *stats.activity())
+        final_message += format_ranking(stats)
+
+    return final_message
+
+
+def format_comparison(previous_obj: records.StatsSnapshot, current_obj: records.StatsSnapshot, filter: str, data: records.StatsDelta) -> records.StatsDelta:
+    period = "Compared last week (%s)" % (
+        filter == "time" and "Time" or "Day"
+    )
+    
+    data.week_change = current_obj - previous_obj
+    
+    return data
+
+    # return "\n\n".join([
+    #     message
+    #     for message in [
+    #         formatted_message_compare(
+    #             "hold", previous_obj.hold, change_in_hold, current_obj.hold,
+    #         ),
+    #         formatted_message_compare(
+    #             "deposits", previous_obj.deposits, change_in_deposits, current_obj.deposits,
+    #         ),
+    #         formatted_message_compare(
+    #             "withdrawals", previous_obj.withdrawals, change_in_withdrawals, current_obj.withdrawals,
+    #         ),
+    #         # formatted_message_compare(
+    #         #     "commission", previous_obj.commission, change_in_commission, current_obj.commission,
+    #         # ),
+    #         formatted_message_compare(
+    #             "pool", previous_obj.pool, change_in_pool, current_obj.pool,
+    #         ),
+    #         # formatted_message_compare(
+    #         #     "balance", previous_obj.balance, change_in_balance, current_obj.balance,
+    #         # ),
+    #         # formatted_message_compare(
+    #         #     "bonus", previous_obj.bonus, change_in_bonus, current_obj.bonus,
+    #         # ),
+    #         "\n".join(mapping["bottom"]) % (
+    #             format_change(int(change_in_visitors)),
+    #             format_change(int(change_in_registrations)),
+    #             format_percentage_change(change_in_registrations_avg),
+    #             format_change(int(change_in_ftd)),
+    #             format_percentage_change(change_in_ftd_avg),
+    #         ),
+    #     ]
+    # ]).replace("Income: ", "Difference: ").replace("Outcome: ", "Difference: ")\
+    #     .replace("$-", "-$").strip() + str("\n\n📅 %s" % period)
+
+
 def send_message(bot_token: str, chat_id: str, message: str) -> None:
     try:
         res = requests.get(
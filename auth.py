@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import httpx
+
+import accounts
+import core
+
+logger = None
+
+AUTH_FAILURE_CODES = (401, 419)
+
+
+def is_auth_failure(res: httpx.Response) -> bool:
+    if res is None:
+        return False
+    if res.status_code in AUTH_FAILURE_CODES:
+        return True
+    try:
+        return b"Unauthenticated" in res.content
+    except httpx.ResponseNotRead:
+        # Streamed responses are checked by status code only
+        return False
+
+
+def is_session_cookie(name: str) -> bool:
+    # Laravel's session cookie is "<app>_session" (laravel_session by default)
+    return name == "XSRF-TOKEN" or name.endswith("_session")
+
+
+def cookies_expiring(cookies: httpx.Cookies, within: float) -> bool:
+    # A session cookie running out soon means the next check is likely a full login.
+    # Lapsed cookies linger in the jar, they say nothing about the current session.
+    now = time.time()
+    return any(
+        is_session_cookie(cookie.name)
+        and cookie.expires is not None and now <= cookie.expires < now + within
+        for cookie in cookies.jar
+    )
+
+
+class AuthState:
+    """Last verified login together with the account info scraped from the dashboard."""
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        # Concurrent callers share a single login
+        self.lock = asyncio.Lock()
+        self.verified_at: float = None
+        self.account_status: str = None
+        self.account_email: str = None
+        self.account_id: str = None
+
+    def remember(self, account_status: str, account_email: str, account_id: str) -> None:
+        self.verified_at = time.monotonic()
+        self.account_status = account_status
+        self.account_email = account_email
+        self.account_id = account_id
+
+    def is_fresh(self) -> bool:
+        return (
+            self.verified_at is not None
+            and time.monotonic() - self.verified_at < self.ttl
+        )
+
+    def invalidate(self, reason: str = "") -> None:
+        if self.verified_at is not None and logger:
+            logger.debug("Login state invalidated: %s" % (reason or "manual"))
+        self.verified_at = None
+
+    def account(self) -> tuple[str, str, str]:
+        return self.account_status, self.account_email, self.account_id
+
+
+state = accounts.Scoped("auth_state", lambda account: AuthState(ttl=core.auth_ttl))
@@ -0,0 +1,200 @@
+"""
+Offline benchmarks of the parsing and rendering hot paths, run on the HTML
+captures committed with the repo (response.html, withdrawal_request*.html).
+
+    python benchmark.py                 # compare against the stored baseline
+    python benchmark.py --save          # store the current run as the baseline
+    python benchmark.py -k history      # only the benchmarks matching "history"
+
+Every benchmark reports ops/sec (best of `--repeat` rounds) and the Python
+memory one call allocates: the tracemalloc peak and what its result keeps
+alive (libxml2's own buffers are not traced). A benchmark slower than the
+baseline by more than `--tolerance` is flagged and the script exits with 1.
+
+benchmark_baseline.json is committed with the numbers of the reference
+machine it names (python, machine), on other hardware run `--save` once
+before comparing.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import alert
+import extract
+import records
+
+fixtures_path = Path(__file__).parent
+baseline_path = fixtures_path.joinpath("benchmark_baseline.json")
+
+FIXTURES = {
+    "dashboard": "response.html",
+    "history": "withdrawal_request.html",
+    "request": "withdrawal_request_1.html",
+}
+
+# Same shape as the brief-stats JSON of pocketpartners
+STATISTICS_JSON = {
+    "sum_depo": "12480.55", "sum_commission": "3120.14", "sum_wdrl": "8200.00",
+    "balance": "1843.20", "bonus": "25.00", "clicks": 5820, "regs": 412, "count_ftd": 97,
+}
+
+
+def load_fixtures() -> dict[str, bytes]:
+    return {
+        name: fixtures_path.joinpath(file_name).read_bytes()
+        for name, file_name in FIXTURES.items()
+    }
+
+
+def first_history_row(content: bytes, chunk_size: int = 4096) -> records.PaymentRow:
+    stream = extract.HistoryStream()
+    for start in range(0, len(content), chunk_size):
+        if rows := stream.feed(content[start:start + chunk_size]):
+            return rows[0]
+    return extract.first(stream.close())
+
+
+def make_delta() -> records.StatsDelta:
+    current = records.StatsSnapshot.from_json(STATISTICS_JSON)
+    previous = records.StatsSnapshot(deposits=12000.0, commission=3000.0, withdrawals=8200.0, balance=1800.0)
+    delta = records.StatsDelta.from_previous(
+        "Current week", current, previous,
+        account_status="AMBASSADOR", account_email="affiliate@example.com", account_id="775125"
+    )
+    delta.rank, delta.deposits_sum = "7", "$812,191.95"
+    return alert.format_comparison(
+        records.StatsSnapshot(visitors=5100, registrations=380, registrations_avg=7, ftd=90, ftd_avg=23.68),
+        current, "time", delta
+    )
+
+
+def benchmarks(fixtures: dict[str, bytes]) -> dict:
+    delta = make_delta()
+    current = delta.current
+    last_week = records.StatsSnapshot(visitors=5100, registrations=380, registrations_avg=7, ftd=90, ftd_avg=23.68)
+
+    cases = {
+        "parse.dashboard": lambda: extract.parse(fixtures["dashboard"]),
+        "parse.history": lambda: extract.parse(fixtures["history"]),
+        "extract.account_info": lambda: extract.account_info(extract.parse(fixtures["dashboard"])),
+        "extract.history_rows": lambda: extract.history_rows(extract.parse(fixtures["history"])),
+        "extract.history_first_row_stream": lambda: first_history_row(fixtures["history"]),
+        "extract.errors": lambda: extract.errors(extract.parse(fixtures["request"])),
+        "records.snapshot_from_json": lambda: records.StatsSnapshot.from_json(STATISTICS_JSON),
+        "alert.format_comparison": lambda: alert.format_comparison(last_week, current, "time", delta),
+        "alert.formatted_message": lambda: [
+            alert.formatted_message(name, *delta.money(name)) for name in alert.ALERT_FIGURES
+        ],
+        "alert.format_only_change": lambda: alert.format_only_change(delta, "Current week"),
+        "alert.format_even_no_change": lambda: alert.format_even_no_change(delta, "Current week"),
+    }
+
+    try:
+        from bs4 import BeautifulSoup as bs
+    except ImportError:
+        pass
+    else:
+        # Reference point: the BeautifulSoup parses the extractors replaced
+        cases["reference.bs4_account_info"] = lambda: [
+            span.text.strip()
+            for span in bs(fixtures["dashboard"], "lxml").find_all("span", class_="text-truncate-md")
+        ]
+        cases["reference.bs4_history_rows"] = lambda: [
+            [td.text.strip() for td in tr.select("td")]
+            for tr in bs(fixtures["history"], "lxml").select("#panel-1 tr")
+        ]
+    return cases
+
+
+def measure(func, repeat: int, min_time: float) -> dict:
+    # Calibrating the loop count so one round lasts at least `min_time`
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ops_per_sec": round(loops / best, 2),
+        "mean_us": round(best / loops * 1e6, 2),
+        "peak_kib": round((peak - before) / 1024, 1),
+        "retained_kib": round((after - before) / 1024, 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Parsing and rendering benchmarks on the HTML fixtures")
+    parser.add_argument("-k", dest="keyword", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per round")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    args = parser.parse_args()
+
+    # Rendering is measured without the commission.db lookup it does on the side
+    alert.get_commission_sums_from_db = lambda: (2900.0, 220.14, 3120.14, 120.14)
+
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    results = {}
+    regressions = []
+
+    print("%-36s %14s %12s %10s %12s  %s" % ("benchmark", "ops/sec", "mean (us)", "peak KiB", "retained KiB", "vs baseline"))
+    for name, func in benchmarks(load_fixtures()).items():
+        if args.keyword and args.keyword not in name:
+            continue
+        result = results[name] = measure(func, args.repeat, args.min_time)
+
+        comparison = ""
+        if previous := baseline.get("results", {}).get(name):
+            ratio = result["ops_per_sec"] / previous["ops_per_sec"]
+            comparison = "%+.1f%%" % ((ratio - 1) * 100)
+            if ratio < 1 - args.tolerance:
+                comparison += "  REGRESSION"
+                regressions.append(name)
+        print("%-36s %14s %12s %10s %12s  %s" % (
+            name, "{:,.1f}".format(result["ops_per_sec"]), result["mean_us"],
+            result["peak_kib"], result["retained_kib"], comparison
+        ))
+
+    if args.save:
+        baseline_path.write_text(json.dumps({
+            "python": sys.version.split()[0],
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "results": {**baseline.get("results", {}), **results},
+        }, indent=2))
+        print("\nBaseline saved: %s" % baseline_path.name)
+
+    if regressions:
+        print("\n%s benchmark(s) regressed beyond %s%%: %s" % (
+            len(regressions), round(args.tolerance * 100), ", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+End-to-end benchmark of one account's scrape and withdrawal cycles, run
+against the local mock of pocketpartners (mock_server.py) instead of the
+network: login (captcha and OTP included), statistics, ratings and the
+payments history go through the real code paths of main.py.
+
+    python benchmark_cycle.py                       # 10 cycles, no latency
+    python benchmark_cycle.py --latency 0.15 --error-rate 0.05
+    python benchmark_cycle.py --session-ttl 2 --otp --auto-withdrawal
+
+Each cycle reports its wall time and the requests and bytes it caused, the
+run ends with the totals per route. Nothing is written outside a temporary
+directory and no Telegram message is sent.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pyotp
+
+import accounts
+import captcha
+import core
+import main
+import mock_server
+import models
+import sessions
+
+
+class CollectingOutbox:
+    """Takes the place of a shard outbox, keeps what would have been sent."""
+
+    def __init__(self) -> None:
+        self.items = []
+
+    def put(self, kind: str, account: str, payload) -> None:
+        self.items.append((kind, account, payload))
+
+
+def route_table(stats: mock_server.MockStats) -> str:
+    lines = ["%-44s %9s %7s %12s %12s" % ("route", "requests", "errors", "bytes in", "bytes out")]
+    for name, route in sorted(stats.routes.items()):
+        lines.append("%-44s %9s %7s %12s %12s" % (
+            name, route.requests, route.errors,
+            "{:,}".format(route.bytes_in), "{:,}".format(route.bytes_out)))
+    total = stats.total()
+    lines.append("%-44s %9s %7s %12s %12s" % (
+        "total", total.requests, total.errors,
+        "{:,}".format(total.bytes_in), "{:,}".format(total.bytes_out)))
+    return "\n".join(lines)
+
+
+async def timed(site: mock_server.MockPocketPartners, coro) -> tuple[float, int, int]:
+    before = site.stats.total()
+    started = time.perf_counter()
+    await coro
+    elapsed = time.perf_counter() - started
+    after = site.stats.total()
+    return elapsed * 1000, after.requests - before.requests, after.bytes_out - before.bytes_out
+
+
+async def run(args: argparse.Namespace, path: Path) -> int:
+    secret = pyotp.random_base32()
+    site = mock_server.MockPocketPartners(
+        latency=args.latency, error_rate=args.error_rate, session_ttl=args.session_ttl,
+        otp_secret=args.otp and secret or None, seed=args.seed
+    )
+    account = accounts.Account("mock", {
+        **core.config,
+        "email": "affiliate@example.com",
+        "password": "mock-password",
+        "google_auth_secret_key": secret,
+    }, path)
+    account.chat_ids_path.write_text("1\n")
+
+    # The whole network goes to the mock, the captcha is never really solved
+    sessions.upstream = site.transport()
+    core.captcha_fake_delay = args.captcha_delay
+    captcha.solver = captcha.fake_solve
+    main.OUTBOX = outbox = CollectingOutbox()
+    models.db_name = path.joinpath("benchmark.db").as_posix()
+
+    await main.db_init([account])
+    try:
+        return await accounts.run_as(account, cycles, args, site, outbox)
+    finally:
+        await main.close_accounts([account])
+
+
+async def cycles(args: argparse.Namespace, site: mock_server.MockPocketPartners, outbox: CollectingOutbox) -> int:
+    if args.auto_withdrawal:
+        await models.toggle_auto_withdrawal("on")
+        await models.update_withdrawal_settings(args.withdrawal_amount, 1)
+    history_obj = await main.load_history()
+
+    results = {"statistics": [], "withdrawal": []}
+    print("%-6s %-11s %10s %9s %12s" % ("cycle", "job", "wall ms", "requests", "bytes out"))
+    for cycle in range(1, args.cycles + 1):
+        for job, coro in [
+            ("statistics", lambda: main.get_statistics()),
+            ("withdrawal", lambda: main.withdrawal_cycle(history_obj)),
+        ]:
+            wall_ms, requests, bytes_out = await timed(site, coro())
+            results[job].append(wall_ms)
+            print("%-6s %-11s %10.1f %9s %12s" % (cycle, job, wall_ms, requests, "{:,}".format(bytes_out)))
+        if args.interval:
+            await asyncio.sleep(args.interval)
+
+    print()
+    print(route_table(site.stats))
+    print()
+    for job, timings in results.items():
+        print("%-11s median %8.1f ms   max %8.1f ms" % (job, statistics.median(timings), max(timings)))
+    print("messages    %s queued" % sum(kind == "message" for kind, _, _ in outbox.items))
+    return 0
+
+
+def main_cli() -> int:
+    parser = argparse.ArgumentParser(description="Scrape and withdrawal cycles against the local mock site")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.0, help="seconds between cycles")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request (+/- 20%%)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    parser.add_argument("--session-ttl", type=float, default=None, help="seconds before a login expires")
+    parser.add_argument("--otp", action="store_true", help="ask for the 2FA code on login")
+    parser.add_argument("--auto-withdrawal", action="store_true", help="turn auto-withdrawal on")
+    parser.add_argument("--withdrawal-amount", type=int, default=60)
+    parser.add_argument("--captcha-delay", type=float, default=0.05, help="seconds the fake captcha takes")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="pocketpartners-mock-") as tmp:
+        return asyncio.run(run(args, Path(tmp)))
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
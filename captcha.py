@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from anticaptchaofficial.recaptchav2proxyless import recaptchaV2Proxyless
+
+import accounts
+import core
+
+logger = None
+
+# The anti-captcha client polls with blocking sleeps, it gets its own threads
+# so neither the event loop nor the default executor are held up. A solve
+# never outlives its timeout (see DeadlineSolver), so the threads free up
+# in time for the next attempt and the warmer.
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="captcha")
+
+
+class CaptchaError(Exception):
+    pass
+
+
+class DeadlineSolver(recaptchaV2Proxyless):
+    """
+    recaptchaV2Proxyless that stops polling for the result at `deadline`
+    (monotonic) or once `abandoned` is set, instead of after 300 polls.
+    """
+
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self.abandoned = threading.Event()
+
+    def expired(self) -> bool:
+        return self.abandoned.is_set() or time.monotonic() >= self.deadline
+
+    def wait_for_result(self, max_seconds=300, current_second=0):
+        # Called again for every poll of the task result
+        if self.expired():
+            self.err_string = "task solution expired"
+            return 0
+        return super().wait_for_result(max_seconds, current_second)
+
+
+def new_solver(website_url: str, website_key: str, timeout: float) -> DeadlineSolver:
+    solver = DeadlineSolver(deadline=time.monotonic() + timeout)
+    solver.set_verbose(0)
+    solver.set_key(core.anticaptcha_api_key)
+    solver.set_website_url(website_url)
+    solver.set_website_key(website_key)
+    return solver
+
+
+def solve_blocking(solver: DeadlineSolver) -> tuple[str, str]:
+    g_response = solver.solve_and_return_solution()
+    if g_response != 0:
+        return g_response, None
+    if solver.expired():
+        # Gave up waiting, there is no wrong answer to report
+        return None, "timeout"
+
+    try:
+        solver.report_incorrect_recaptcha()
+    except Exception:
+        pass
+    return None, solver.error_code
+
+
+async def solve(website_url: str, website_key: str, timeout: float = None, attempts: int = None) -> str:
+    """
+    Solves a reCAPTCHA v2 in the captcha executor.
+    Cancelling the caller (or the timeout) stops the wait right away, the
+    worker thread gives up at its next poll of the result.
+    """
+    timeout = timeout or core.captcha_timeout
+    attempts = attempts or core.captcha_attempts
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(1, attempts + 1):
+        solver = new_solver(website_url, website_key, timeout)
+        try:
+            g_response, error_code = await asyncio.wait_for(
+                loop.run_in_executor(executor, solve_blocking, solver),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            error_code = "timeout after %ss" % timeout
+            logger.warning("Abandoned reCAPTCHA solve (task %s) after %ss" % (
+                solver.task_id or "not created", timeout))
+        else:
+            if g_response:
+                logger.debug("reCAPTCHA solved (attempt %s/%s)" % (attempt, attempts))
+                return g_response
+        finally:
+            solver.abandoned.set()
+
+        logger.warning("ERR_SOLVE_RECAPTCHA (attempt %s/%s): %s" % (
+            attempt, attempts, error_code
+        ))
+
+    raise CaptchaError("reCAPTCHA could not be solved after %s attempts" % attempts)
+
+
+async def fake_solve(website_url: str, website_key: str) -> str:
+    # Local stand-in for tests, no anti-captcha balance is spent
+    await asyncio.sleep(core.captcha_fake_delay)
+    return "fake-g-response-%s" % int(time.time() * 1000)
+
+
+class TokenPool:
+    """
+    Keeps a few recently solved tokens ready while a login looks imminent.
+    reCAPTCHA tokens are valid for about 2 minutes, they are dropped
+    `margin` seconds before that and solved again while the pool is armed.
+    """
+
+    def __init__(self, website_url: str, website_key: str, size: int = 1,
+                 validity: float = 110.0, margin: float = 15.0, solver=None) -> None:
+        self.website_url = website_url
+        self.website_key = website_key
+        self.size = size
+        self.validity = validity
+        self.margin = margin
+        # None: the module's `solver`, looked up on every solve
+        self.solver = solver
+        self.tokens: deque[tuple[str, float]] = deque()
+        self.armed_until = 0.0
+        self.task: asyncio.Task = None
+
+    def prune(self) -> None:
+        now = time.monotonic()
+        while self.tokens and now - self.tokens[0][1] > self.validity - self.margin:
+            self.tokens.popleft()
+
+    def take(self) -> str | None:
+        self.prune()
+        if self.tokens:
+            token, _ = self.tokens.popleft()
+            logger.debug("Using pre-solved reCAPTCHA token (%s left)" % len(self.tokens))
+            return token
+
+    def arm(self, reason: str, duration: float = 300.0) -> None:
+        self.armed_until = max(self.armed_until, time.monotonic() + duration)
+        if self.task is None or self.task.done():
+            logger.debug("reCAPTCHA warmer armed: %s" % reason)
+            self.task = asyncio.get_running_loop().create_task(self.run(), name="captcha-warmer")
+
+    def disarm(self) -> None:
+        self.armed_until = 0.0
+        self.tokens.clear()
+        if self.task is not None:
+            self.task.cancel()
+
+    async def run(self) -> None:
+        while time.monotonic() < self.armed_until:
+            self.prune()
+            if len(self.tokens) < self.size:
+                try:
+                    token = await (self.solver or solver)(self.website_url, self.website_key)
+                except Exception as e:
+                    logger.warning("ERR_CAPTCHA_WARMER: %s" % e)
+                    await asyncio.sleep(10)
+                else:
+                    self.tokens.append((token, time.monotonic()))
+                continue
+
+            # Sleeping until the oldest token needs replacing
+            expires_in = self.validity - self.margin - (time.monotonic() - self.tokens[0][1])
+            await asyncio.sleep(max(1.0, min(expires_in, self.armed_until - time.monotonic())))
+        self.tokens.clear()
+
+
+# What logins and the warmers solve with, fake_solve with `captcha_fake` on
+solver = core.captcha_fake and fake_solve or solve
+
+# Logins are per account, so are their warmers: one account logging in
+# must not throw away the tokens armed for another
+tokens = accounts.Scoped("captcha_tokens", lambda account: TokenPool(
+    website_url=core.login_link,
+    website_key=core.recaptcha_site_key,
+    size=core.captcha_pool_size,
+))
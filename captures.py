@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+import zipfile
+import zlib
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+import accounts
+import core
+
+logger = None
+
+
+class Capture:
+    __slots__ = ("created", "method", "url", "status_code", "elapsed", "size", "body")
+
+    def __init__(self, response: httpx.Response, body: bytes) -> None:
+        self.created = time.time()
+        self.method = response.request.method
+        self.url = str(response.url)
+        self.status_code = response.status_code
+        self.elapsed = round(response.elapsed.total_seconds(), 3)
+        self.size = len(response.content)
+        self.body = body
+
+    def meta(self) -> dict:
+        return {
+            "created": datetime.fromtimestamp(self.created).isoformat(),
+            "method": self.method,
+            "url": self.url,
+            "status_code": self.status_code,
+            "elapsed": self.elapsed,
+            "size": self.size,
+            "compressed_size": len(self.body),
+        }
+
+
+class CaptureBuffer:
+    """
+    Keeps the last `size` responses of every endpoint, zlib compressed,
+    in memory. `export()` dumps them into a zip for post-mortems.
+    """
+
+    def __init__(self, size: int = 5, enabled: bool = False) -> None:
+        self.size = size
+        # Not tied to the log level, the logger always runs at DEBUG
+        self.enabled = enabled
+        self.captures: dict[str, deque[Capture]] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def record(self, endpoint: str, response: httpx.Response) -> None:
+        if not self.enabled or response is None:
+            return
+        # Compression happens off the event loop
+        endpoint = "%s/%s" % (accounts.current().name, endpoint)
+        task = asyncio.get_running_loop().create_task(self._record(endpoint, response))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _record(self, endpoint: str, response: httpx.Response) -> None:
+        try:
+            body = await asyncio.to_thread(zlib.compress, response.content, 6)
+            self.captures.setdefault(endpoint, deque(maxlen=self.size)).append(
+                Capture(response, body))
+        except Exception as e:
+            logger.exception("ERR_CAPTURE_RESPONSE: %s | %s" % (endpoint, e))
+
+    def export(self, reason: str = "manual") -> Path:
+        path = core.captures_path.joinpath("%s_%s.zip" % (
+            datetime.now().strftime("%Y%m%d_%H%M%S"), reason))
+        index = {}
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for endpoint, captures in list(self.captures.items()):
+                index[endpoint] = []
+                for number, capture in enumerate(list(captures)):
+                    name = "%s/%s.html" % (endpoint, number)
+                    archive.writestr(name, zlib.decompress(capture.body))
+                    index[endpoint].append({"file": name, **capture.meta()})
+            archive.writestr("index.json", json.dumps(index, indent=2))
+        logger.debug("Debug captures exported: %s" % path)
+        return path
+
+    async def export_async(self, reason: str = "manual") -> Path | None:
+        # Waiting for captures still being compressed
+        if self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        if not self.captures:
+            return None
+        try:
+            return await asyncio.to_thread(self.export, reason)
+        except Exception as e:
+            logger.exception("ERR_EXPORT_CAPTURES: %s" % e)
+
+
+buffer = CaptureBuffer(size=core.debug_capture_size, enabled=core.debug_capture)
@@ -1,4 +1,5 @@
 import logging
+import os
 import pyotp
 import json
 import requests
@@ -10,14 +11,19 @@ from pathlib import Path
 from dotenv import dotenv_values
 from python_anticaptcha import AnticaptchaClient, NoCaptchaTaskProxylessTask
 
+import state
+import accounts
+
 project_name = "pocketoption"
 
 script_path = Path.cwd()
-cookies_path = script_path.joinpath("cookies.json")
-messages_path = script_path.joinpath("messages.txt")
+accounts_path = script_path.joinpath("accounts")
 credentials_path = script_path.joinpath("credentials.env")
+proxies_path = script_path.joinpath("proxies.txt")
 logs_path = script_path.joinpath("logs")
 logs_path.mkdir(exist_ok=True)
+captures_path = logs_path.joinpath("captures")
+captures_path.mkdir(exist_ok=True)
 
 
 # Logging Based
@@ -47,8 +53,94 @@ password = config["password"]
 google_auth_secret_key = config.get("google_auth_secret_key")
 anticaptcha_api_key = config.get("anticaptcha_api_key")
 
+# The root credentials.env is the default account (see accounts.py)
+accounts.logger = logger
+accounts.default = accounts.Account("default", config, script_path)
+
+
+def make_store(account: accounts.Account) -> state.StateStore:
+    return state.StateStore(account.state_path)
+
+
+# Durable runtime state of the active account, replaces cookies.json /
+# messages.txt / last_withdrawal_message.txt
+state.logger = logger
+store = accounts.Scoped("store", make_store)
+
 client = AnticaptchaClient(anticaptcha_api_key)
 
+# HTTP connection pool tuning (optional, see sessions.py)
+http2_enabled = str(config.get("http2") or "").lower() in ("1", "true", "yes", "on")
+pool_max_connections = int(config.get("pool_max_connections") or 10)
+pool_max_keepalive = int(config.get("pool_max_keepalive") or 5)
+pool_keepalive_expiry = float(config.get("pool_keepalive_expiry") or 60.0)
+request_timeout = float(config.get("request_timeout") or 60.0)
+
+# Seconds a verified login is trusted before the dashboard is checked again
+auth_ttl = float(config.get("auth_ttl") or 600.0)
+
+# Seconds a fetched page (e.g. payments history) is shared between callers
+page_cache_ttl = float(config.get("page_cache_ttl") or 30.0)
+
+# Upper bound of requests issued at once by a single scrape
+max_concurrency = int(config.get("max_concurrency") or 4)
+
+# HTML parsing (see extract.py): pages from this size (bytes) up are parsed
+# off the event loop, in threads or, for one-shot extractions, processes
+parse_inline_threshold = int(config.get("parse_inline_threshold") or 32 * 1024)
+parse_workers = int(config.get("parse_workers") or 2)
+parse_processes = str(config.get("parse_processes") or "").lower() in ("1", "true", "yes", "on")
+
+# Staggered scheduling (see scheduling.py): every account scrapes at its own
+# second inside `scrape_window`, which ends `scrape_lead` seconds before :00
+scrape_window = float(config.get("scrape_window") or 240.0)
+scrape_lead = float(config.get("scrape_lead") or 30.0)
+# Withdrawal checks are spread over up to this many seconds of their interval
+withdrawal_window = float(config.get("withdrawal_window") or 120.0)
+# How late the :00 alert may still go out, e.g. after a scrape that overran
+alert_grace = float(config.get("alert_grace") or 300.0)
+# Longest sleep of the job scheduler, how soon /stop is noticed
+scheduler_nap = float(config.get("scheduler_nap") or 5.0)
+
+# Adaptive statistics watch between the hourly scrapes: polled every
+# `watch_floor` seconds while the figures move, backing off to `watch_ceiling`
+# while they do not, never more than `watch_budget` requests an hour per account
+watch_statistics = str(config.get("watch_statistics") or "").lower() in ("1", "true", "yes", "on")
+watch_floor = float(config.get("watch_floor") or 60.0)
+watch_ceiling = float(config.get("watch_ceiling") or 3600.0)
+watch_budget = int(config.get("watch_budget") or 30)
+# Moves since the last alert that are worth a message right away
+watch_thresholds = {
+    name: float(config.get("watch_%s_threshold" % name) or default)
+    for name, default in (("deposits", 500.0), ("commission", 100.0), ("balance", 100.0))
+}
+
+# Scrape and alert pipelines (see pipeline.py): room in every stage queue,
+# and how many messages are sent to Telegram at once
+pipeline_queue_size = int(config.get("pipeline_queue_size") or 16)
+delivery_workers = int(config.get("delivery_workers") or 2)
+
+# Worker processes the accounts are spread over (see shards.py), 1 runs them all in-process
+shard_count = max(int(config.get("shards") or 1), 1)
+
+# Seconds the in-memory withdrawal settings are served before the row is read
+# again, bounds how long a change made by another process goes unseen
+settings_ttl = float(config.get("settings_ttl") or 60.0)
+
+# reCAPTCHA solving (see captcha.py)
+recaptcha_site_key = "6LeF_OQeAAAAAMl5ATxF48du4l-4xmlvncSUXGKR"
+captcha_timeout = float(config.get("captcha_timeout") or 180.0)
+captcha_attempts = int(config.get("captcha_attempts") or 3)
+# Pre-solved token pool, only armed when a login looks imminent
+captcha_prewarm = str(config.get("captcha_prewarm") or "").lower() in ("1", "true", "yes", "on")
+captcha_pool_size = int(config.get("captcha_pool_size") or 1)
+captcha_fake = str(config.get("captcha_fake") or "").lower() in ("1", "true", "yes", "on")
+captcha_fake_delay = float(config.get("captcha_fake_delay") or 1.0)
+
+# Debug HTML captures (see captures.py), off unless enabled here or in the environment
+debug_capture = str(os.environ.get("POCKET_DEBUG_CAPTURE", config.get("debug_capture")) or "").lower() in ("1", "true", "yes", "on")
+debug_capture_size = int(config.get("debug_capture_size") or 5)
+
 
 # Required Links
 # home_link = logged_in_link = "https://affiliate.pocketoption.com/en/dashboard"
@@ -70,7 +162,6 @@ payment_request_link = "https://pocketpartners.com/en/payments/request"
 payment_history_link = "https://pocketpartners.com/en/payments/history"
 top_10_affiliates_link = "https://pocketpartners.com/en/ratings/top"
 
-session: httpx.AsyncClient = None
 cookies = {}
 
 # Loading Target Chat ids for Telegram alerts
@@ -78,60 +169,74 @@ chat_ids = []
 
 
 def get_auth_code() -> str:
-    if google_auth_secret_key:
-        return pyotp.TOTP(google_auth_secret_key).now()
+    return accounts.current().get_auth_code()
+
+
+def import_legacy_file(key: str, path: Path, parse) -> None:
+    # One-off migration of the old plain files into the state store
+    if store.get(key) is not None or not path.exists():
+        return
+    try:
+        store.set(key, parse(path.read_text(encoding="utf-8")))
+        logger.debug("Imported %s into the state store" % path.name)
+    except Exception as e:
+        logger.exception("ERR_IMPORT_LEGACY_FILE: %s | %s" % (path.name, e))
 
 
-def load_chatids() -> list[str]:
+def load_chatids(account: accounts.Account = None) -> list[str]:
+    # chat_ids.txt stays the editable source, it is only re-read when it changed
+    account = account or accounts.current()
+    account_store = account.instance("store", make_store)
     try:
-        return [
-            line.strip()
-            for line in open("chat_ids.txt", "r").read().split("\n")
-            if line.strip()
-        ]
+        mtime = account.chat_ids_path.stat().st_mtime
+        if mtime != account_store.get("chat_ids_mtime"):
+            account_store.set("chat_ids", [
+                line.strip()
+                for line in account.chat_ids_path.read_text().split("\n")
+                if line.strip()
+            ])
+            account_store.set("chat_ids_mtime", mtime)
+        return account_store.get("chat_ids")
     except Exception as e:
         logger.exception("ERR_LOAD_CHATIDS: %s" % e)
+        return account_store.get("chat_ids")
 
 
 def save_cookies(s: httpx.AsyncClient) -> None:
+    # Only marks the cookies dirty, the state flusher writes them out
     try:
-        cookies = dict(s.cookies)
-        with open(cookies_path.as_posix(), "w") as f:
-            json.dump(cookies, f)
+        store.set("cookies", dict(s.cookies))
     except httpx.CookieConflict:
         pass
     except Exception as e:
         logger.exception("ERR_SAVE_COOKIES: %s" % e)
-    else:
-        logger.debug("Cookies Saved!!")
 
 
 def load_cookies() -> dict:
-    try:
-        with cookies_path.open("r") as f:
-            return json.load(f)
-    except Exception as e:
-        logger.exception("ERR_LOADING_OLD_SESSION: %s" % e)
-    return {}
+    import_legacy_file("cookies", accounts.current().cookies_path, json.loads)
+    return dict(store.get("cookies") or {})
 
 
 def save_messages(messages: list[str]) -> None:
-    try:
-        with open(messages_path.as_posix(), "w", encoding="utf-8") as f:
-            f.write("\n\n\n\n\n\n\n\n\n\n".join(messages))
-    except Exception as e:
-        logger.exception("ERR_SAVE_MESSAGES: %s" % e)
+    store.set("messages", list(messages))
 
 
 def load_messages() -> list[str]:
-    try:
-        if not messages_path.exists():
-            return []
+    import_legacy_file("messages", accounts.current().messages_path, lambda text: text.split("\n\n\n\n\n\n\n\n\n\n"))
+    return list(store.get("messages") or [])
 
-        with messages_path.open("r", encoding="utf-8") as f:
-            return f.read().split("\n\n\n\n\n\n\n\n\n\n")
-    except Exception as e:
-        logger.exception("ERR_LOADING_MESSAGES: %s" % e)
+
+def save_withdrawal_receipt(message: str, limit: int = 50) -> None:
+    # The receipt of the old last_withdrawal_message.txt is kept as the first one
+    path = accounts.current().withdrawal_message_path
+    import_legacy_file("withdrawal_receipts", path, lambda text: [
+        {"message": text, "created": path.stat().st_mtime}
+    ])
+    receipts = store.get("withdrawal_receipts") or []
+    store.set("withdrawal_receipts", (receipts + [{
+        "message": message,
+        "created": time.time(),
+    }])[-limit:])
 
 
 def fix_message_format(value: str) -> str:
@@ -149,13 +254,12 @@ report_headers = {
 }
 
 def delete_cookies() -> None:
-    """Delete the cookies.json file to remove all saved cookies."""
+    """Remove all saved cookies (state store and the legacy cookies.json)."""
     try:
-        if cookies_path.exists():
-            cookies_path.unlink()
-            logger.debug("Cookies file deleted!")
-        else:
-            logger.debug("Cookies file does not exist.")
+        store.delete("cookies")
+        if accounts.current().cookies_path.exists():
+            accounts.current().cookies_path.unlink()
+        logger.debug("Cookies deleted!")
     except Exception as e:
         logger.exception(f"ERR_DELETE_COOKIES: {e}")
 
@@ -0,0 +1,213 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from lxml import etree, html
+
+import core
+from records import PaymentRow
+
+logger = None
+
+# lxml releases the GIL while it parses, so parse threads run in parallel
+# with the event loop instead of stalling it
+executor = ThreadPoolExecutor(max_workers=core.parse_workers, thread_name_prefix="parse")
+# Only used for one-shot extractions when `parse_processes` is on, lxml
+# trees cannot leave the process they were built in
+process_executor: ProcessPoolExecutor = None
+
+
+def has_class(name: str) -> str:
+    # XPath 1.0 has no class selector, this is what `.name` compiles to
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+
+# Compiled once, evaluated straight on the lxml tree
+_status = etree.XPath("(//span[%s])[1]" % has_class("status-block-color"))
+_account_spans = etree.XPath("//span[%s]" % has_class("text-truncate-md"))
+_token = etree.XPath("(//*[@name='_token'])[1]/@value")
+_otp_input = etree.XPath("boolean(//input[@name='one_time_password'])")
+_ranking_row = etree.XPath("(//table)[1]//tr[%s][1]" % has_class("bg-info-50"))
+_cell = etree.XPath("(.//td[@data-label=$label])[1]")
+_alerts = etree.XPath("//div[%s]" % has_class("alert-danger"))
+_alert_title = etree.XPath("(.//strong)[1]")
+_alert_item = etree.XPath("(.//ul//li)[1]")
+_history_rows = etree.XPath("//*[@id='panel-1']//tr[td]")
+_history_cells = etree.XPath("td[@data-label]")
+
+
+def parse(content: str | bytes) -> html.HtmlElement:
+    return html.document_fromstring(content)
+
+
+def extract_from(extractor, content: str | bytes):
+    return extractor(parse(content))
+
+
+def inline(content: str | bytes) -> bool:
+    return len(content) < core.parse_inline_threshold
+
+
+async def offload(func, content: str | bytes):
+    # Small pages are cheaper to parse than to hand over to a thread
+    if inline(content):
+        return func(content)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, content)
+
+
+async def parse_async(content: str | bytes) -> html.HtmlElement:
+    return await offload(parse, content)
+
+
+async def run(extractor, content: str | bytes):
+    """`extractor(parse(content))` off the event loop, only the result comes back."""
+    global process_executor
+    if inline(content):
+        return extract_from(extractor, content)
+    # Shard workers are daemonic processes, they are not allowed children
+    if core.parse_processes and not multiprocessing.current_process().daemon:
+        if process_executor is None:
+            process_executor = ProcessPoolExecutor(max_workers=core.parse_workers)
+        pool = process_executor
+    else:
+        pool = executor
+    return await asyncio.get_running_loop().run_in_executor(pool, extract_from, extractor, content)
+
+
+def shutdown() -> None:
+    executor.shutdown(wait=False, cancel_futures=True)
+    if process_executor is not None:
+        process_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def text_of(element) -> str:
+    # itertext() also works on the plain elements of the pull parser
+    return element is not None and "".join(element.itertext()).strip() or ""
+
+
+def first(elements: list):
+    return elements[0] if elements else None
+
+
+# Dashboard (response.html)
+
+def account_info(document: html.HtmlElement) -> tuple[str, str, str]:
+    """`(account_status, account_email, account_id)` from any logged-in page."""
+    status = first(_status(document))
+    account_status = status is not None and text_of(status) or None
+
+    # The profile menu repeats the email, the account block follows it
+    spans = [text_of(span) for span in _account_spans(document)]
+    if len(spans) >= 3:
+        account_email, account_id = spans[1], spans[2]
+    else:
+        account_email, account_id = (spans + [None, None])[:2]
+
+    if account_id:
+        account_id = account_id.split("ID: ")[1].strip()
+    return account_status, account_email, account_id
+
+
+# Forms (login page, payments/request)
+
+def form_token(document: html.HtmlElement) -> str:
+    return first(_token(document))
+
+
+def requires_otp(document: html.HtmlElement) -> bool:
+    return _otp_input(document)
+
+
+# Ratings (ratings/top)
+
+def ranking(document: html.HtmlElement) -> dict | None:
+    if (row := first(_ranking_row(document))) is None:
+        return None
+    return {
+        "rank": text_of(first(_cell(row, label="#"))),
+        "deposits_sum": text_of(first(_cell(row, label="Sum of deposits"))),
+    }
+
+
+# Form errors (withdrawal_request_1.html)
+
+def errors(document: html.HtmlElement) -> str:
+    return "\n".join([
+        "%s: %s" % (
+            text_of(first(_alert_title(div))),
+            text_of(first(_alert_item(div)))
+        )
+        for div in _alerts(document)
+        # Skips the hidden client-side templates, they have no title
+        if first(_alert_title(div)) is not None
+    ])
+
+
+# Payments history (withdrawal_request.html)
+
+def history_row(row) -> PaymentRow | None:
+    if cells := {cell.get("data-label"): text_of(cell) for cell in _history_cells(row)}:
+        return PaymentRow.from_cells(cells)
+    return None
+
+
+def history_rows(document: html.HtmlElement) -> list[PaymentRow]:
+    """Rows of `#panel-1`, newest first."""
+    return [row for row in map(history_row, _history_rows(document)) if row]
+
+
+class HistoryStream:
+    """
+    Incremental `history_rows()`: fed with the response chunks as they come
+    in, it hands back the `#panel-1` rows completed so far. `finished` turns
+    true once the panel is closed, nothing after it needs to be read. Call
+    `close()` once the response ends for the rows still buffered.
+    """
+
+    # libxml2's push parser loses (or crashes on) rows when fed a few bytes
+    # at a time, network chunks are gathered up to this size first
+    feed_size = 8 * 1024
+
+    def __init__(self) -> None:
+        self.parser = etree.HTMLPullParser(events=("start", "end"))
+        self.buffer = bytearray()
+        self.depth = 0
+        self.finished = False
+
+    def feed(self, chunk: bytes) -> list[PaymentRow]:
+        if self.finished:
+            return []
+        self.buffer += chunk
+        if len(self.buffer) < self.feed_size:
+            return []
+        return self.parse(close=False)
+
+    def close(self) -> list[PaymentRow]:
+        if self.finished:
+            return []
+        return self.parse(close=True)
+
+    def parse(self, close: bool) -> list[PaymentRow]:
+        rows = []
+        if self.buffer:
+            self.parser.feed(bytes(self.buffer))
+            self.buffer.clear()
+        if close:
+            self.parser.close()
+        for event, element in self.parser.read_events():
+            if event == "start":
+                if self.depth or element.get("id") == "panel-1":
+                    self.depth += 1
+                continue
+            if not self.depth:
+                continue
+            self.depth -= 1
+            if not self.depth:
+                self.finished = True
+                break
+            if element.tag == "tr":
+                if row := history_row(element):
+                    rows.append(row)
+                # Rows already handed out are not kept in the tree
+                element.clear()
+        return rows
@@ -1,6 +1,5 @@
 import time
 import logging
-from bs4 import BeautifulSoup as bs
 from threading import Event
 import os
 import sqlite3
@@ -8,7 +7,21 @@ import sqlite3
 import models
 import alert
 import core
+import accounts
+import sessions
+import auth
+import proxies
+import retry
+import page_cache
+import captcha
+import captures
+import shards
+import scheduling
+import extract
+import records
+import pipeline
 import asyncio
+import contextlib
 import httpx
 
 from tortoise import Tortoise, run_async
@@ -23,20 +36,34 @@ from aiogram.utils.formatting import Text
 from aiogram import exceptions
 import xtras
 from router import router as start_router
-# from python_anticaptcha import NoCaptchaTaskProxylessTask, recaptchaV2Proxyless
-from anticaptchaofficial.recaptchav2proxyless import recaptchaV2Proxyless
 
-os.system("title pocketoption [%s]" % core.email)
+# Spawned shard workers re-import this file as __mp_main__ (see shards.py),
+# the console title, the startup chat ids and the bot belong to the parent
+SHARD_WORKER = __name__ == "__mp_main__"
 
 DEBUG = True
-core.chat_ids = core.load_chatids()
+if not SHARD_WORKER:
+    os.system("title pocketoption [%s]" % core.email)
+    core.chat_ids = core.load_chatids()
 
 logger: logging.Logger = core.logger
 models.logger = logger
 alert.logger = logger
+sessions.logger = logger
+auth.logger = logger
+proxies.logger = logger
+retry.logger = logger
+page_cache.logger = logger
+captcha.logger = logger
+captures.logger = logger
+shards.logger = logger
+scheduling.logger = logger
+pipeline.logger = logger
+extract.logger = logger
 
 import sys
-print("sys.platform: ", sys.platform)
+if not SHARD_WORKER:
+    print("sys.platform: ", sys.platform)
 if sys.platform == 'win32':
     # Configure StreamHandler to use utf-8 encoding
     console_handler = logging.StreamHandler(sys.stdout)
@@ -45,8 +72,8 @@ if sys.platform == 'win32':
 
 output_format = "%A, %B %d, %Y"
 
-# Telegram Bot Initialization
-bot = Bot(token=core.bot_token)
+# Telegram Bot Initialization, workers send through OUTBOX instead
+bot = None if SHARD_WORKER else Bot(token=core.bot_token)
 dp = Dispatcher()
 
 # Broadcast event
@@ -70,74 +97,67 @@ periods = [
 # Minimum withdrawal amount (in dollars)
 MIN_WITHDRAWAL_AMOUNT = 51
 
+# Set inside shard workers, results and alerts go to the parent through it
+OUTBOX: shards.Outbox = None
+
+# Latest "Current week" figures of every account, for the cross-account totals
+ACCOUNT_STATS: dict[str, dict] = {}
+
 async def get_rotating_proxy():
-    domain = "p.webshare.io"
-    port = 80
-    proxyusername="uyqgyajo-rotate"
-    proxypassword="ia4anr5881l4"
-    # Returns a proxy dict suitable for httpx.AsyncClient, using the credentials above
-    
-    proxy_url = f"http://{proxyusername}:{proxypassword}@{domain}:{port}"
-    return {
-        "http://": proxy_url,
-        "https://": proxy_url
-    }
+    # Returns the healthiest proxy of the pool as a dict suitable for httpx.AsyncClient
+    return proxies.as_httpx_proxies(proxies.pool.pick())
 
-async def db_init():
+async def db_connect():
     await Tortoise.init(
         db_url="sqlite://%s" % models.db_name,
         modules={"models": ["models"]}
     )
+
+async def db_init(account_list: list[accounts.Account] = None):
+    await db_connect()
+    await models.migrate_before_schemas()
     await Tortoise.generate_schemas()
-    if not await models.Withdrawal.first():
-        # Default withdrawal setting
-        logger.debug("Creating default setting for Auto-withdrawal")
-        await models.Withdrawal(**{
-            "auto": False,
-            "auto_all": True
-        }).save()
+    await models.migrate_after_schemas()
+    for account in account_list or [accounts.default]:
+        if not await models.Withdrawal.filter(account=account.name).first():
+            # Default withdrawal setting
+            logger.debug("Creating default setting for Auto-withdrawal (%s)" % account.name)
+            await models.Withdrawal(**{
+                "account": account.name,
+                "auto": False,
+                "auto_all": True
+            }).save()
 
 async def db_close():
     await Tortoise.close_connections()
 
+async def switch_proxy(kind: str, error: Exception) -> None:
+    if kind != retry.TRANSPORT:
+        return
+    proxies.pool.record_failure(sessions.manager.active_proxy)
+    # Rotate the proxy on the pooled session (cookies are kept)
+    await sessions.manager.rotate(await get_rotating_proxy())
+
 async def fetch(url: str, **kwargs) -> httpx.Response:
-    max_retries = 3
-    retry_count = 0
+    async def attempt() -> httpx.Response:
+        response = await sessions.manager.client.get(url, **kwargs)
+        proxies.pool.record_success(
+            sessions.manager.active_proxy, response.elapsed.total_seconds())
+        if auth.is_auth_failure(response):
+            auth.state.invalidate("%s -> %s" % (url, response.status_code))
+            prewarm_captcha("auth failure on %s" % url)
+        return retry.check_response(response)
+
     try:
-        while retry_count < max_retries:
-            try:
-                response = await core.session.get(url, **kwargs)
-                return response
-            except (httpx.ConnectError, httpx.ProxyError, httpx.ReadTimeout, httpx.ConnectTimeout) as e:
-                retry_count += 1
-                logger.warning(f"Proxy connection error (attempt {retry_count}/{max_retries}): {str(e)}")
-                if retry_count < max_retries:
-                    # Get a new rotating proxy (each call gets a new proxy from the rotating pool)
-                    new_proxy = await get_rotating_proxy()
-                    if new_proxy:
-                        # Close current session and create new one with new proxy
-                        await core.session.aclose()
-                        transport = httpx.AsyncHTTPTransport(retries=3)
-                        core.session = httpx.AsyncClient(
-                            headers=core.base_headers,
-                            transport=transport,
-                            follow_redirects=True,
-                            proxies=new_proxy,
-                            timeout=60.0
-                        )
-                        logger.info(f"Switched to new rotating proxy for retry {retry_count}")
-                        await asyncio.sleep(2)  # Brief delay before retry
-                    else:
-                        logger.error("No rotating proxy available for retry")
-                        break
-                else:
-                    logger.error(f"All proxy retry attempts failed for URL: {url}")
-                    raise
-            except Exception as e:
-                logger.error(f"Unexpected error in fetch: {str(e)}")
-                raise
+        return await retry.fetch_policy.run(
+            attempt, breaker=retry.breaker_for(url), on_retry=switch_proxy, label="GET %s" % url)
+    except retry.RetryableError as e:
+        # Handing back the last response, callers check the status code themselves
+        if e.response is not None:
+            return e.response
+        raise
     finally:
-        core.save_cookies(core.session)
+        core.save_cookies(sessions.manager.client)
 
 def generate_otp_payload() -> dict:
     otp = core.get_auth_code()
@@ -145,9 +165,9 @@ def generate_otp_payload() -> dict:
         "one_time_password": "%s %s" % (otp[:3], otp[3:])
     }
 
-def generate_payment_payload(data: bs, _type: str, balance: int | float) -> dict:
+def generate_payment_payload(data: extract.html.HtmlElement, _type: str, balance: int | float) -> dict:
     payload = {
-        "_token": data.select_one('[name="_token"]').get("value"),
+        "_token": extract.form_token(data),
         "_method": "POST",
         "amount": str(balance),
         # "balance_type": _type.lower() == "balance" and "balance" or "bonus_balance",
@@ -157,38 +177,28 @@ def generate_payment_payload(data: bs, _type: str, balance: int | float) -> dict
         "user_data[100][uids]": "",
     }
     
-    if data.select_one('input[name="one_time_password"]'):
+    if extract.requires_otp(data):
         # print("generate_otp_payload: ", generate_otp_payload())
         payload.update(generate_otp_payload())
 
     return payload
 
+def prewarm_captcha(reason: str) -> None:
+    if core.captcha_prewarm:
+        captcha.tokens.arm(reason)
+
 async def get_recaptcha_code() -> str:
-    loop = asyncio.get_running_loop()
-    
-    solver = recaptchaV2Proxyless() # Here the magic starts
-    solver.set_verbose(0)
-    solver.set_key(core.anticaptcha_api_key)
-    solver.set_website_url(core.login_link)
-    solver.set_website_key("6LeF_OQeAAAAAMl5ATxF48du4l-4xmlvncSUXGKR")
-    g_response = solver.solve_and_return_solution()
-    if g_response != 0: # If answer not 0, success!
-        print("[ ] g-response SUCCESS")
-        return g_response
-        return
-    else:
-        print("[ ] Task finished with error "+solver.error_code)
-        print("[ ] Reporting anticaptcha error via API.")
-        solver.report_incorrect_image_captcha() # Report anticaptcha error to the API
-        print("[ ] Refreshing page...")
-        # driver.refresh() # Refresh page and try again if anticaptcha didn't work
-        print("[ ] Trying again.")
-
-async def generate_login_payload(data: bs, otp_verify: bool = False) -> dict:
+    # Taking a pre-solved token when the warmer has one ready
+    if token := captcha.tokens.take():
+        return token
+    # Solved off the event loop, the bot keeps answering during a re-login
+    return await captcha.solver(core.login_link, core.recaptcha_site_key)
+
+async def generate_login_payload(data: extract.html.HtmlElement, otp_verify: bool = False) -> dict:
     payload = {
-        "_token": data.select_one('[name="_token"]').get("value"),
-        "email": core.email,
-        "password": core.password,
+        "_token": extract.form_token(data),
+        "email": accounts.current().email,
+        "password": accounts.current().password,
     }
     
     print("payload", payload)
@@ -214,26 +224,17 @@ def validate_amount(amount: int | float) -> int | float:
 def calculate_pool_value(deposits: float, withdrawals: float, hold: float) -> float:
     return round((float(deposits-withdrawals)*0.7)-hold, 2)
 
-async def save_statistics_log(period: str, data: dict) -> None:
+async def save_statistics_log(period: str, stats: records.StatsDelta) -> None:
     if period != "Current week":
         return
 
     try:
         io_log_obj = models.StatisticsLog(**{
             "period": period,
-            "account_status": data["account_status"],
-            "account_email": data["account_email"],
-            "account_id": data["account_id"],
-            "deposits": data["deposits_current"],
-            "commission": data["commission_current"],
-            "withdrawals": data["withdrawals_current"],
-            "balance": data["balance_current"],
-            "bonus": data["bonus_current"],
-            "visitors": data["visitors"],
-            "registrations": data["registrations"],
-            "registrations_avg": data["registrations_avg"],
-            "ftd": data["ftd"],
-            "ftd_avg": data["ftd_avg"],
+            "account_status": stats.account_status,
+            "account_email": stats.account_email,
+            "account_id": stats.account_id,
+            **stats.current.as_dict(),
         })
         await io_log_obj.save()
     except Exception as e:
@@ -247,9 +248,12 @@ async def get_last_week_data() -> models.StatisticsLog | None:
     one_week_ago = one_week_ago.replace(microsecond=0) + timedelta(hours=7)
     
     # Try to get data from that exact hour or the latest before it
+    # Ranged on the (account, hour_bucket) index instead of scanning `updated`
     last_week_data = await models.StatisticsLog.filter(
+        account=models.current_account(),
+        hour_bucket__gte=models.hour_bucket_of(one_week_ago),
         updated__gte=one_week_ago  # >= means "greater than or equal to"
-    ).order_by('updated').first()
+    ).order_by('hour_bucket', 'id').first()
     
     if last_week_data:
         logger.debug(f"Found data from: {last_week_data.updated}")
@@ -258,384 +262,169 @@ async def get_last_week_data() -> models.StatisticsLog | None:
     
     return last_week_data
 
-async def process_statistics(period: str, account_status: str = None, account_email: str = None, account_id: str = None, update_db: bool = True, failsafe: bool = False) -> dict:
-    data = {}
-    try:
-        res_statistics = await fetch(
-            url=period == "Total" and core.statistics_link or core.statistics_current_week_link,
-            headers=core.report_headers
-        )
-        logger.debug("Response: %s | %s" % (
-            res_statistics.status_code, res_statistics.url
-        ))
+async def relogin_on_auth_error(kind: str, error: Exception) -> None:
+    if kind == retry.AUTH:
+        # Not piling logins on a host that is already failing (or being probed)
+        retry.breaker_for(core.login_link).check(probe=False)
+        await perform_login(force=True)
 
-        if res_statistics.status_code != 200:
-            await perform_login()
-            await asyncio.sleep(2)
-            return await process_statistics(period, account_status, account_email, account_id, update_db=update_db, failsafe=True)
-            
+async def load_statistics_json(period: str) -> dict:
+    res_statistics = await fetch(
+        url=period == "Total" and core.statistics_link or core.statistics_current_week_link,
+        headers=core.report_headers
+    )
+    logger.debug("Response: %s | %s" % (
+        res_statistics.status_code, res_statistics.url
+    ))
+
+    # Only a lost session is worth a new login, a failing host is retried as is
+    if auth.is_auth_failure(res_statistics):
+        raise retry.AuthError("HTTP %s" % res_statistics.status_code, res_statistics)
+    if res_statistics.status_code >= 500 or res_statistics.status_code == 429:
+        raise retry.ServerError("HTTP %s" % res_statistics.status_code, res_statistics)
+    if res_statistics.status_code != 200:
+        raise retry.PayloadError("HTTP %s" % res_statistics.status_code, res_statistics)
+
+    try:
         res_json = res_statistics.json()
-        
-        if "clicks" not in res_json or res_json["clicks"] is None:
-            logger.error("Missing or null 'clicks' data in statistics response")
-            if failsafe:
-                return data
-            await asyncio.sleep(2)
-            return await process_statistics(period, account_status, account_email, account_id, update_db=update_db, failsafe=True)
-            
-        print(res_json)
-        # if "clicks" in res_json:
-        if "clicks" in res_json and res_json["clicks"] is not None:
-            account_status = account_status or "unknown"
-            account_email = account_email or "unknown"
-            account_id = account_id or "unknown"
-            
-            change_in_deposits = 0
-            change_in_commission = 0
-            change_in_withdrawals = 0
-            change_in_pool = 0
-            change_in_balance = 0
-            change_in_bonus = 0
-
-            old_deposits = deposits = float(res_json["sum_depo"] or 0.0)
-            old_commission = commission = float(res_json["sum_commission"] or 0.0)
-            old_withdrawals = withdrawals = float(res_json["sum_wdrl"] or 0.0)
-            old_balance = balance = float(res_json["balance"] or 0.0)
-            old_bonus = bonus = float(res_json.get("bonus") or 0.0)
-
-            visitors = int(res_json["clicks"])
-            registrations = int(res_json["regs"])
-            ftd = int(res_json["count_ftd"])
-
-            registrations_avg = 0
-            ftd_avg = 0
-            if visitors:
-                registrations_avg = int((registrations/visitors)*100)
-
-            if registrations:
-                ftd_avg = round((ftd/registrations)*100, 2)
-
-            io_obj: models.Statistics = None
-            if update_db:
-                io_obj = await models.Statistics.get_or_none(period=period)
-                if not io_obj:
-                    io_obj = await models.Statistics.create(
-                        period=period,
-                        deposits=deposits,
-                        old_deposits=deposits,
-                        commission=commission,
-                        old_commission=commission,
-                        withdrawals=withdrawals,
-                        old_withdrawals=withdrawals,
-                        balance=balance,
-                        old_balance=balance,
-                        bonus=bonus,
-                        old_bonus=bonus,
-                        account_status=account_status,
-                        account_email=account_email,
-                        account_id=account_id
-                    )
-                    await io_obj.save()
-                    
-                    old_deposits = 0
-                    old_commission = 0
-                    old_withdrawals = 0
-                    old_balance = 0
-                    old_bonus = 0
-                else:
-                    old_deposits = io_obj.deposits
-                    old_commission = io_obj.commission
-                    old_withdrawals = io_obj.withdrawals
-                    old_balance = io_obj.balance
-                    old_bonus = io_obj.bonus
-
-            # print("io_obj.deposits: ", old_deposits)
-            # print("io_obj.commission: ", old_commission)
-            # print("io_obj.withdrawals: ", old_withdrawals)
-            # print("io_obj.hold: ", old_hold)
-            # print("io_obj.pool: ", old_pool)
-            # print("io_obj.balance: ", old_balance)
-            # print("io_obj.bonus: ", old_bonus)
-            
-            # print(res_json)
-
-            change_in_deposits = round(deposits - old_deposits, 2)
-            change_in_commission = round(commission - old_commission, 2)
-            change_in_withdrawals = round(withdrawals - old_withdrawals, 2)
-            change_in_balance = round(balance - old_balance, 2)
-            change_in_bonus = round(bonus - old_bonus, 2)
-
-            data.update({
-                "deposits_old": old_deposits,
-                "deposits_change": change_in_deposits,
-                "deposits_current": deposits,
-
-                "commission_old": old_commission,
-                "commission_change": change_in_commission,
-                "commission_current": commission,
-
-                "withdrawals_old": old_withdrawals,
-                "withdrawals_change": change_in_withdrawals,
-                "withdrawals_current": withdrawals,
-
-                "balance_old": old_balance,
-                "balance_change": change_in_balance,
-                "balance_current": balance,
-
-                "bonus_old": old_bonus,
-                "bonus_change": change_in_bonus,
-                "bonus_current": bonus,
-
-                "visitors": visitors,
-                "registrations": registrations,
-                "ftd": ftd,
-                "registrations_avg": registrations_avg,
-                "ftd_avg": ftd_avg,
-                "account_status": account_status,
-                "account_email": account_email,
-                "account_id": account_id
+    except ValueError:
+        raise retry.PayloadError("Statistics response is not JSON", res_statistics)
+
+    if not isinstance(res_json, dict) or res_json.get("clicks") is None:
+        raise retry.PayloadError("Missing or null 'clicks' data in statistics response", res_statistics)
+
+    return res_json
+
+# Statistics pipeline stages, see statistics_pipeline()
+
+async def fetch_statistics(scrape: records.StatsScrape) -> records.StatsScrape:
+    scrape.res_json = await retry.payload_policy.run(
+        lambda: load_statistics_json(scrape.period),
+        on_retry=relogin_on_auth_error,
+        label="Statistics (%s)" % scrape.period
+    )
+    logger.debug("Statistics (%s): %s" % (scrape.period, scrape.res_json))
+    return scrape
+
+# Per account: (period, update_db) -> (fingerprint, StatsDelta, hour bucket) of the last full pass
+statistics_fingerprints = accounts.Scoped("statistics_fingerprints", lambda account: {})
+
+async def fingerprint_statistics(scrape: records.StatsScrape) -> records.StatsScrape:
+    current = records.StatsSnapshot.from_json(scrape.res_json)
+    scrape.fingerprint = current.fingerprint()
+    entry = statistics_fingerprints.instance().get((scrape.period, scrape.update_db))
+    # Once an hour the full pass runs anyway: a log row per hour is what the
+    # week-over-week lookups rely on, and last week's hour moved on
+    if not entry or entry[0] != scrape.fingerprint or entry[2] != models.current_hour_bucket():
+        return scrape
+
+    # Same figures as the last full pass of this hour: the stored row, the
+    # log and last week's comparison all still hold
+    scrape.unchanged = True
+    scrape.stats = entry[1].repeated(**scrape.account())
+
+    store = core.store.instance()
+    heartbeat = store.get("heartbeat:%s" % scrape.period) or {}
+    store.set("heartbeat:%s" % scrape.period, {
+        "fingerprint": scrape.fingerprint,
+        "checked": time.time(),
+        "unchanged": heartbeat.get("fingerprint") == scrape.fingerprint and heartbeat.get("unchanged", 0) + 1 or 1,
+    })
+    logger.debug("Statistics (%s) unchanged [%s]" % (scrape.period, scrape.fingerprint))
+    return scrape
+
+async def diff_statistics(scrape: records.StatsScrape) -> records.StatsScrape:
+    if scrape.unchanged:
+        return scrape
+    current = records.StatsSnapshot.from_json(scrape.res_json)
+    # Nothing to compare against without the stored scrape (first run included)
+    previous = current
+
+    if scrape.update_db:
+        io_obj = await models.Statistics.get_or_none(account=models.current_account(), period=scrape.period)
+        if io_obj:
+            scrape.stored = True
+            previous = records.StatsSnapshot(**{
+                name: getattr(io_obj, name) for name in records.MONEY_FIELDS
             })
+        else:
+            previous = records.StatsSnapshot()
 
-            if io_obj is not None:
-                io_obj.deposits = deposits
-                io_obj.commission = commission
-                io_obj.withdrawals = withdrawals
-                io_obj.balance = balance
-                io_obj.bonus = bonus
-                io_obj.account_status = account_status
-                io_obj.account_email = account_email
-                io_obj.account_id = account_id
-                io_obj.old_deposits = old_deposits
-                io_obj.old_commission = old_commission
-                io_obj.old_withdrawals = old_withdrawals
-                io_obj.old_balance = old_balance
-                io_obj.old_bonus = old_bonus
-                await io_obj.save()
-
-        # print("io_obj: ", io_obj)
-    except Exception as e:
-        if failsafe:
+    stats = records.StatsDelta.from_previous(scrape.period, current, previous, **scrape.account())
+
+    last_week_data = await get_last_week_data()
+    logger.debug("Last week data: %s" % last_week_data)
+    scrape.stats = alert.format_comparison(
+        last_week_data and records.StatsSnapshot.from_row(last_week_data) or stats.current,
+        stats.current, "time", stats
+    )
+    return scrape
+
+async def persist_statistics(scrape: records.StatsScrape) -> records.StatsScrape:
+    if scrape.unchanged:
+        return scrape
+
+    if scrape.update_db:
+        stats = scrape.stats
+        values = {
+            **{name: getattr(stats.current, name) for name in records.MONEY_FIELDS},
+            **{"old_%s" % name: getattr(stats.old, name) for name in records.MONEY_FIELDS},
+            # Statistics keeps the status only, update() rejects unknown fields
+            "account_status": scrape.account_status,
+        }
+        try:
+            if not scrape.stored or not await models.Statistics.filter(
+                    account=models.current_account(), period=scrape.period).update(**values):
+                await models.Statistics.create(period=scrape.period, **values)
+        except Exception as e:
             logger.exception("ERR_PROCESS_SUMMARY -> Period: %s -> Error: %s" % (
-                period, e
+                scrape.period, e
             ))
-        else:
-            await asyncio.sleep(2)
-            return await process_statistics(period, account_status, account_email, account_id, update_db=update_db, failsafe=True)
-    else:
-        if update_db:
-            await save_statistics_log(period, data)
-            logger.debug("Processed -> Statistics -> %s" % period.capitalize())
-
-    io_log_obj = models.StatisticsLog(**{
-        "period": period,
-        "account_status": data["account_status"],
-        "account_email": data["account_email"],
-        "account_id": data["account_id"],
-        "deposits": data["deposits_current"],
-        "commission": data["commission_current"],
-        "withdrawals": data["withdrawals_current"],
-        "balance": data["balance_current"],
-        "bonus": data["bonus_current"],
-        "visitors": data["visitors"],
-        "registrations": data["registrations"],
-        "registrations_avg": data["registrations_avg"],
-        "ftd": data["ftd"],
-        "ftd_avg": data["ftd_avg"],
-    })
-    
-    last_week_data = await get_last_week_data()
-    print("last_week_data: ", last_week_data)
-    if not last_week_data:
-        last_week_data = io_log_obj
-    # print("last_week_data-deposits: ", last_week_data.deposits)
-    # print("last_week_data-commission: ", last_week_data.commission)
-    # print("last_week_data-withdrawals: ", last_week_data.withdrawals)
-    # print("last_week_data-hold: ", last_week_data.hold)
-    # print("last_week_data-pool: ", last_week_data.pool)
-    # print("last_week_data-balance: ", last_week_data.balance)
-    # print("last_week_data-bonus: ", last_week_data.bonus)
-    # print("last_week_data-visitors: ", last_week_data.visitors)
-    # print("last_week_data-registrations: ", last_week_data.registrations)
-    # print("last_week_data-registrations_avg: ", last_week_data.registrations_avg)
-    # print("last_week_data-ftd: ", last_week_data.ftd)
-    # print("last_week_data-ftd_avg: ", last_week_data.ftd_avg)
-    # print("last_week_data-account_status: ", last_week_data.account_status)
-    # print("last_week_data-period: ", last_week_data.period)
-    # print("last_week_data-updated: ", last_week_data.updated)
-    compared_data = format_comparison(last_week_data, io_log_obj, "time", data)
-    # print("compared_data: ", compared_data)
-    return compared_data
+            return scrape
+
+        await save_statistics_log(scrape.period, stats)
+        logger.debug("Processed -> Statistics -> %s" % scrape.period.capitalize())
+
+        if scrape.period == "Current week":
+            # commission.db is plain sqlite3, kept off the event loop
+            await asyncio.to_thread(save_commission_to_db, *stats.money("commission"))
+            report_statistics({scrape.period: stats})
+
+    statistics_fingerprints.instance()[(scrape.period, scrape.update_db)] = (
+        scrape.fingerprint, scrape.stats, models.current_hour_bucket())
+    return scrape
+
+async def process_statistics(period: str, account_status: str = None, account_email: str = None, account_id: str = None, update_db: bool = True) -> records.StatsDelta | None:
+    """The statistics stages run inline, for callers that need the figures right away."""
+    scrape = records.StatsScrape(
+        period,
+        account_status=account_status or "unknown",
+        account_email=account_email or "unknown",
+        account_id=account_id or "unknown",
+        update_db=update_db,
+    )
+    try:
+        await fetch_statistics(scrape)
+        await fingerprint_statistics(scrape)
+        await diff_statistics(scrape)
+    except Exception as e:
+        logger.exception("ERR_PROCESS_SUMMARY -> Period: %s -> Error: %s" % (
+            period, e
+        ))
+        return None
+    return (await persist_statistics(scrape)).stats
 
 
 async def get_top_10_affiliates() -> dict:
     res = await fetch(core.top_10_affiliates_link, headers=core.report_headers)
     
     if res.status_code == 200:
-        soup = bs(res.text, "lxml")
-        table = soup.find("table")
-        if table:
-            # Find the specific row with class "bg-info-50"
-            highlighted_row = table.find("tr", class_="bg-info-50")
-            if highlighted_row:
-                return {
-                    "rank": highlighted_row.find("td", {"data-label": "#"}).text.strip(),
-                    "deposits_sum": highlighted_row.find("td", {"data-label": "Sum of deposits"}).text.strip()
-                }
-        return None
+        # The highlighted ("bg-info-50") row of the ratings table is ours
+        return await extract.run(extract.ranking, res.content)
     else:
         logger.exception("ERR_GET_TOP_10_AFFILIATES: %s" % res.status_code)
         return None
 
-def format_only_change(stats: dict, period: str) -> str:
-    final_message = None
-    # if stats["hold_change"]:
-    
-    final_message = "\n\n".join([
-        message.strip()
-        for message in [
-            alert.formatted_message(
-                "balance", stats["balance_old"], stats["balance_change"], stats["balance_current"], stats["week_change_in_balance"],
-            ),
-            alert.formatted_message(
-                "deposits", stats["deposits_old"], stats["deposits_change"], stats["deposits_current"], stats["week_change_in_deposits"],
-            ),
-            alert.formatted_message(
-                "withdrawals", stats["withdrawals_old"], stats["withdrawals_change"], stats["withdrawals_current"], stats["week_change_in_withdrawals"],
-            ),
-            alert.formatted_message(
-                "commission",  stats["commission_old"], stats["commission_change"], stats["commission_current"], stats["week_change_in_commission"],
-            ),
-            alert.formatted_message(
-                "bonus", stats["bonus_old"], stats["bonus_change"], stats["bonus_current"], stats["week_change_in_bonus"],
-            )
-        ]
-        if message and message.strip()
-    ])
-
-    # if final_message:
-    final_message += "\n\n" + alert.formatted_message(
-        "bottom", stats["visitors"], stats["registrations"], stats["registrations_avg"], stats["ftd"], stats["ftd_avg"],
-        stats["week_change_in_visitors"], stats["week_change_in_registrations"], stats["week_change_in_registrations_avg"], stats["week_change_in_ftd"], stats["week_change_in_ftd_avg"]
-    )
-    final_message += "\n\n🏆 *Ranking*\n🎖 Position: %s\n💵 Sum of deposits: %s\n\n⚙️ Account Status: %s\n👤 Account Email: %s\n🆔 Account ID: %s" % (stats["rank"], stats["deposits_sum"], stats["account_status"], stats["account_email"], stats["account_id"])
-
-    return final_message
-
-def format_even_no_change(stats: dict, period: str) -> str:
-    final_message = "\n\n".join([
-        message.strip()
-        for message in [
-                # alert.formatted_message_even_no_change(
-                #     "hold", stats["hold_old"], stats["hold_change"], stats["hold_current"], stats["week_change_in_hold"],
-                # ),
-                alert.formatted_message_even_no_change(
-                    "balance", stats["balance_old"], stats["balance_change"], stats["balance_current"], stats["week_change_in_balance"],
-                ),
-                alert.formatted_message_even_no_change(
-                    "deposits", stats["deposits_old"], stats["deposits_change"], stats["deposits_current"], stats["week_change_in_deposits"],
-                ),
-                alert.formatted_message_even_no_change(
-                    "withdrawals", stats["withdrawals_old"], stats["withdrawals_change"], stats["withdrawals_current"], stats["week_change_in_withdrawals"],
-                ),
-                alert.formatted_message_even_no_change(
-                    "commission",  stats["commission_old"], stats["commission_change"], stats["commission_current"], stats["week_change_in_commission"],
-                ),
-                alert.formatted_message_even_no_change(
-                    "bonus", stats["bonus_old"], stats["bonus_change"], stats["bonus_current"], stats["week_change_in_bonus"],
-                )
-            ]
-            if message and message.strip()
-    ])
-
-    if final_message:
-        final_message += "\n\n" + alert.formatted_message_even_no_change(
-            "bottom", stats["visitors"], stats["registrations"], stats["registrations_avg"], stats["ftd"], stats["ftd_avg"],
-            stats["week_change_in_visitors"], stats["week_change_in_registrations"], stats["week_change_in_registrations_avg"], stats["week_change_in_ftd"], stats["week_change_in_ftd_avg"]
-        )
-        final_message += "\n\n🏆 *Ranking*\n🎖 Position: %s\n💵 Sum of deposits: %s\n\n⚙️ Account Status: %s\n👤 Account Email: %s\n🆔 Account ID: %s" % (stats["rank"], stats["deposits_sum"], stats["account_status"], stats["account_email"], stats["account_id"])
-
-    return final_message
-
-def format_comparison(previous_obj: models.StatisticsLog, current_obj: models.StatisticsLog, filter: str, data: dict) -> str:
-    print("deposits: ", previous_obj.deposits)
-    print("previous_obj.commission: ", previous_obj.commission)
-    print("previous_obj.withdrawals: ", previous_obj.withdrawals)
-    print("previous_obj.balance: ", previous_obj.balance)
-    print("previous_obj.bonus: ", previous_obj.bonus)
-    print("previous_obj.visitors: ", previous_obj.visitors)
-    print("previous_obj.registrations: ", previous_obj.registrations)
-    print("previous_obj.registrations_avg: ", previous_obj.registrations_avg)
-    print("previous_obj.ftd: ", previous_obj.ftd)
-    print("previous_obj.ftd_avg: ", previous_obj.ftd_avg)
-    
-    
-    change_in_deposits = round(current_obj.deposits - previous_obj.deposits, 2)
-    change_in_commission = round(
-        current_obj.commission - previous_obj.commission, 2)
-    change_in_withdrawals = round(
-        current_obj.withdrawals - previous_obj.withdrawals, 2)
-    change_in_balance = round(current_obj.balance - previous_obj.balance, 2)
-    change_in_bonus = round(current_obj.bonus - previous_obj.bonus, 2)
-    change_in_visitors = round(current_obj.visitors - previous_obj.visitors, 2)
-    change_in_registrations = round(
-        current_obj.registrations - previous_obj.registrations, 2)
-    change_in_registrations_avg = round(
-        current_obj.registrations_avg - previous_obj.registrations_avg, 2)
-    change_in_ftd = round(current_obj.ftd - previous_obj.ftd, 2)
-    change_in_ftd_avg = round(current_obj.ftd_avg - previous_obj.ftd_avg, 2)
-
-    period = "Compared last week (%s)" % (
-        filter == "time" and "Time" or "Day"
-    )
-    
-    data["week_change_in_deposits"] = change_in_deposits
-    data["week_change_in_commission"] = change_in_commission
-    data["week_change_in_withdrawals"] = change_in_withdrawals
-    data["week_change_in_balance"] = change_in_balance
-    data["week_change_in_bonus"] = change_in_bonus
-    data["week_change_in_visitors"] = change_in_visitors
-    data["week_change_in_registrations"] = change_in_registrations
-    data["week_change_in_registrations_avg"] = change_in_registrations_avg
-    data["week_change_in_ftd"] = change_in_ftd
-    data["week_change_in_ftd_avg"] = change_in_ftd_avg
-    
-    return data
-
-    # return "\n\n".join([
-    #     message
-    #     for message in [
-    #         alert.formatted_message_compare(
-    #             "hold", previous_obj.hold, change_in_hold, current_obj.hold,
-    #         ),
-    #         alert.formatted_message_compare(
-    #             "deposits", previous_obj.deposits, change_in_deposits, current_obj.deposits,
-    #         ),
-    #         alert.formatted_message_compare(
-    #             "withdrawals", previous_obj.withdrawals, change_in_withdrawals, current_obj.withdrawals,
-    #         ),
-    #         # alert.formatted_message_compare(
-    #         #     "commission", previous_obj.commission, change_in_commission, current_obj.commission,
-    #         # ),
-    #         alert.formatted_message_compare(
-    #             "pool", previous_obj.pool, change_in_pool, current_obj.pool,
-    #         ),
-    #         # alert.formatted_message_compare(
-    #         #     "balance", previous_obj.balance, change_in_balance, current_obj.balance,
-    #         # ),
-    #         # alert.formatted_message_compare(
-    #         #     "bonus", previous_obj.bonus, change_in_bonus, current_obj.bonus,
-    #         # ),
-    #         "\n".join(alert.mapping["bottom"]) % (
-    #             alert.format_change(int(change_in_visitors)),
-    #             alert.format_change(int(change_in_registrations)),
-    #             alert.format_percentage_change(change_in_registrations_avg),
-    #             alert.format_change(int(change_in_ftd)),
-    #             alert.format_percentage_change(change_in_ftd_avg),
-    #         ),
-    #     ]
-    # ]).replace("Income: ", "Difference: ").replace("Outcome: ", "Difference: ")\
-    #     .replace("$-", "-$").strip() + str("\n\n📅 %s" % period)
-
 def format_withdrawal(_type: str, amount: int | float, mode: str = "Bot", wallet_str: str = "") -> str:
     # import locale
 
@@ -654,27 +443,58 @@ def format_withdrawal(_type: str, amount: int | float, mode: str = "Bot", wallet
     ]).strip()
 
 
-async def get_statistics() -> dict[str, dict]:
+async def gather_bounded(*coros, limit: int = None) -> list:
+    semaphore = asyncio.Semaphore(limit or core.max_concurrency)
+
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(bounded(coro) for coro in coros), return_exceptions=True)
+
+def make_statistics_pipeline(account: accounts.Account) -> pipeline.Pipeline:
+    return pipeline.Pipeline("statistics [%s]" % account.name, [
+        pipeline.Stage("fetch", fetch_statistics, workers=core.max_concurrency),
+        pipeline.Stage("fingerprint", fingerprint_statistics),
+        pipeline.Stage("diff", diff_statistics),
+        pipeline.Stage("persist", persist_statistics),
+    ])
+
+# fetch -> fingerprint -> diff -> persist, one per account
+statistics_pipeline = accounts.Scoped("statistics_pipeline", make_statistics_pipeline)
+
+async def get_statistics() -> dict[str, records.StatsDelta]:
     starting_time = time.time()
     final_info = {}
 
     account_status, account_email, account_id = await perform_login()
     try:
-        # Looping on periods to process reports
-        for period in periods:
-            stats = await process_statistics(period, account_status, account_email, account_id)
-            if stats:
-                top_10 = await get_top_10_affiliates()
+        # The ratings page is fetched while the periods go through the pipeline
+        top_10_task = asyncio.create_task(get_top_10_affiliates())
+        scrapes = [
+            records.StatsScrape(period, account_status or "unknown", account_email or "unknown", account_id or "unknown")
+            for period in periods
+        ]
+        for scrape in scrapes:
+            await statistics_pipeline.put(scrape)
+        await statistics_pipeline.join()
+
+        try:
+            top_10 = await top_10_task
+        except Exception as e:
+            logger.error("ERR_GET_TOP_10_AFFILIATES: %s" % e)
+            top_10 = None
+
+        for scrape in scrapes:
+            # Failed periods never got past their stage, it logged why
+            if stats := scrape.stats:
                 if top_10:
-                    stats.update({
-                        'rank': top_10['rank'],
-                        'deposits_sum': top_10['deposits_sum']
-                    })
+                    stats.rank = top_10['rank']
+                    stats.deposits_sum = top_10['deposits_sum']
                 final_info.update({
-                    period: stats
+                    scrape.period: stats
                 })
-            
-            
+
     except Exception as e:
         logger.exception("ERR_GET_STATISTICS: %s" % e)
     finally:
@@ -682,6 +502,7 @@ async def get_statistics() -> dict[str, dict]:
             "Total time taken to perform the task: %s seconds" %
             round(time.time() - starting_time, 2)
         )
+        logger.debug("Pipeline %s" % statistics_pipeline.summary())
     return final_info
 
 
@@ -694,7 +515,7 @@ def save_commission_to_db(commission_old: float, commission_change: float, commi
         print("commission_current: ", commission_current)
         print("week_change_in_commission: ", week_change_in_commission)
         print("--------------------------------")
-        user_email = core.email 
+        user_email = accounts.current().email
         # Create database connection
         conn = sqlite3.connect("./../commission.db")
         cursor = conn.cursor()
@@ -767,83 +588,71 @@ def send_alert() -> None:
     else:
         logger.debug("No reports were processed!!")
 
-async def perform_login() -> None:
-    # Get a working proxy with testing
+async def perform_login(force: bool = False) -> tuple[str, str, str]:
+    # Reuses the pooled session, it is only built on the first call
     proxy_config = await get_rotating_proxy()
-    if proxy_config:
-        # Close previous session if exists
-        if hasattr(core, "session") and core.session:
-            await core.session.aclose()
-        transport = httpx.AsyncHTTPTransport(retries=3)
-        core.session = httpx.AsyncClient(
-            headers=core.base_headers,
-            transport=transport,
-            follow_redirects=True,
-            proxies=proxy_config,
-            timeout=60.0
-        )
-        logger.info("Created new session with working proxy")
-    else:
-        # Fallback: use existing session or create a new one without proxy
-        if not hasattr(core, "session") or not core.session:
-            core.session = httpx.AsyncClient(
-                headers=core.base_headers,
-                follow_redirects=True,
-                timeout=60.0
-            )
-            logger.warning("No working proxies available, using direct connection")
-            
+    if not proxy_config:
+        logger.warning("No working proxies available, using direct connection")
+    await sessions.manager.ensure(proxy_config)
+    # A faster (or recovered) proxy is taken up again, not only after an error
+    if sessions.proxy_url_of(proxy_config) != sessions.manager.active_proxy:
+        await sessions.manager.rotate(proxy_config)
+
+    if auth.cookies_expiring(sessions.manager.client.cookies, within=300):
+        prewarm_captcha("session cookies expiring")
+
+    # Skipping the dashboard check while the last verified login is still fresh
+    if not force and auth.state.is_fresh():
+        logger.debug("Using cached login state")
+        return auth.state.account()
+
+    # Concurrent callers share a single login
+    verified_at = auth.state.verified_at
+    async with auth.state.lock:
+        if auth.state.is_fresh() and auth.state.verified_at != verified_at:
+            return auth.state.account()
+        return await login_to_dashboard()
+
+async def login_to_dashboard() -> tuple[str, str, str]:
+    auth.state.invalidate("revalidating")
+
     # Loading Old Session cookies
     core.cookies = core.load_cookies()
 
     IS_LOGGED_IN = False
     if core.cookies:
-        core.session.cookies.update(core.cookies)
+        sessions.manager.client.cookies.update(core.cookies)
         try:
-            res = await core.session.get(core.logged_in_link, timeout=30)
+            res = await sessions.manager.client.get(core.logged_in_link, timeout=30)
         except:
             res = None
             
-        if res is not None:
-            # Save the response as an HTML file
-            with open("response.html", "w", encoding="utf-8") as f:
-                f.write(res.text)
+        captures.buffer.record("dashboard", res)
 
         if IS_LOGGED_IN := validate_login(res):
             logger.debug("Old session worked fine.")
-            data = bs(res.text, "lxml")
-            status_span = data.find('span', class_='status-block-color')
-            account_status = status_span.text.strip() if status_span else None
-            print("account_status: ", account_status)
-            account_span = data.find_all('span', class_='text-truncate-md')
-            print("len: ", len(account_span))
-            account_email = ""
-            account_id = ""
-            try:
-                account_email = account_span[1].text.strip() if account_span[1] else None
-                account_id = account_span[2].text.strip() if account_span[2] else None
-            except:
-                account_email = account_span[0].text.strip() if account_span[0] else None
-                account_id = account_span[1].text.strip() if account_span[1] else None
-
-            if account_id:
-                account_id = account_id.split("ID: ")[1].strip()
+            captcha.tokens.disarm()
+            account_status, account_email, account_id = await extract.run(extract.account_info, res.content)
             
             print("Account Status:", account_status)
             print("Account Email: ", account_email)
             print("Account ID: ", account_id)
+            auth.state.remember(account_status, account_email, account_id)
             return account_status, account_email, account_id
             
         else:
             logger.debug("Old Session expired!! Trying to login again..")
-            core.session.cookies.clear()
 
     if not IS_LOGGED_IN:
+        # The pooled client outlives delete_cookies(), a session left in its
+        # jar would get the dashboard instead of the login form
+        sessions.manager.client.cookies.clear()
         try:
-            res = await core.session.get(url=core.home_link, timeout=60.0)  # Increased timeout
-            res_l = await core.session.post(
+            res = await sessions.manager.client.get(url=core.home_link, timeout=60.0)  # Increased timeout
+            login_page = await extract.parse_async(res.content)
+            res_l = await sessions.manager.client.post(
                 url=core.login_link, 
-                data=await generate_login_payload(data=bs(res.text, "lxml")),
+                data=await generate_login_payload(data=login_page),
                 timeout=60.0  # Increased timeout
             )
             print("---------")
@@ -854,9 +663,9 @@ async def perform_login() -> None:
                 max_retries = 3
                 for attempt in range(max_retries):
                     try:
-                        res_l = await core.session.post(
+                        res_l = await sessions.manager.client.post(
                             url=core.otp_verify_link,
-                            data=await generate_login_payload(data=bs(res.text, "lxml"), otp_verify=True),
+                            data=await generate_login_payload(data=login_page, otp_verify=True),
                             timeout=60.0  # Increased timeout
                         )
                         break  # If successful, break the retry loop
@@ -869,48 +678,27 @@ async def perform_login() -> None:
                             raise
             if validate_login(res_l):
                 logger.debug("Logged-In successfully!")
+                captcha.tokens.disarm()
                 print("login")
-                core.save_cookies(core.session)
-                data = bs(res_l.text, "lxml")
-                status_span = data.find('span', class_='status-block-color')
-                account_status = status_span.text.strip() if status_span else None
+                core.save_cookies(sessions.manager.client)
+                account_status, account_email, account_id = await extract.run(extract.account_info, res_l.content)
                 print("Account Status:", account_status)
-                
-                account_span = data.find_all('span', class_='text-truncate-md')
-                print("Len: ", len(account_span))
-                account_email = ""
-                account_id = ""
-                try:
-                    account_email = account_span[1].text.strip() if account_span[1] else None
-                    account_id = account_span[2].text.strip() if account_span[2] else None
-                except:
-                    account_email = account_span[0].text.strip() if account_span[0] else None
-                    account_id = account_span[1].text.strip() if account_span[1] else None
-                
-                if account_id:
-                    account_id = account_id.split("ID: ")[1].strip()
                 print("Account Email: ", account_email)
                 print("Account ID: ", account_id)
+                auth.state.remember(account_status, account_email, account_id)
                 return account_status, account_email, account_id
         except httpx.ReadTimeout as e:
             logger.error(f"Connection timeout: {e}")
             # Try to switch proxy and retry login
             logger.info("Attempting to switch proxy due to timeout")
             try:
+                proxies.pool.record_failure(sessions.manager.active_proxy)
                 new_proxy = await get_rotating_proxy()
                 if new_proxy:
-                    await core.session.aclose()
-                    transport = httpx.AsyncHTTPTransport(retries=3)
-                    core.session = httpx.AsyncClient(
-                        headers=core.base_headers,
-                        transport=transport,
-                        follow_redirects=True,
-                        proxies=new_proxy,
-                        timeout=60.0
-                    )
+                    await sessions.manager.rotate(new_proxy)
                     logger.info("Switched to new rotating proxy due to timeout, retrying login")
                     # Recursive call to retry login with new proxy
-                    return await perform_login()
+                    return await login_to_dashboard()
             except Exception as proxy_error:
                 logger.error(f"Failed to get new rotating proxy after timeout: {proxy_error}")
             raise
@@ -920,44 +708,70 @@ async def perform_login() -> None:
             if "proxy" in str(e).lower() or "connection" in str(e).lower():
                 logger.info("Attempting to switch proxy due to connection error")
                 try:
+                    proxies.pool.record_failure(sessions.manager.active_proxy)
                     new_proxy = await get_rotating_proxy()
                     if new_proxy:
-                        await core.session.aclose()
-                        transport = httpx.AsyncHTTPTransport(retries=3)
-                        core.session = httpx.AsyncClient(
-                            headers=core.base_headers,
-                            transport=transport,
-                            follow_redirects=True,
-                            proxies=new_proxy,
-                            timeout=60.0
-                        )
+                        await sessions.manager.rotate(new_proxy)
                         logger.info("Switched to new rotating proxy due to connection error, retrying login")
                         # Recursive call to retry login with new proxy
-                        return await perform_login()
+                        return await login_to_dashboard()
                 except Exception as proxy_error:
                     logger.error(f"Failed to get new rotating proxy after connection error: {proxy_error}")
             raise
 
-def validate_minute(minute: int) -> bool:
-    # return True
-    return datetime.now(tz=models.pytz.utc).time().minute == minute
+def parse_html(content: bytes) -> extract.html.HtmlElement:
+    return extract.parse(content)
 
-async def validate_minute_withdrawal() -> bool:
-    WITHDRAWAL_AMOUNT, WITHDRAWAL_INTERVAL = await models.get_withdrawal_settings()
-    
-    current_minute = datetime.now(tz=models.pytz.utc).time().minute
-    # return True
-    return current_minute % WITHDRAWAL_INTERVAL == 0
+async def load_page(url: str) -> page_cache.CachedPage:
+    return page_cache.CachedPage(await fetch(url), parse=parse_html)
 
-def get_error(res: httpx.Response) -> str:
-    data = bs(res.text, "lxml")
-    return "\n".join([
-        "%s: %s" % (
-            div.select_one("strong").text.strip(),
-            div.select_one("ul li").text.strip()
-        )
-        for div in data.select("div.alert-danger")
-    ])
+async def get_payment_history(fresh: bool = False) -> page_cache.CachedPage:
+    # One download and one parse of the history page per monitor cycle
+    if fresh:
+        page_cache.pages.invalidate(core.payment_history_link)
+    return await page_cache.pages.get(core.payment_history_link, load_page)
+
+async def iter_payment_history():
+    """
+    History rows, newest first. Unless a fresh copy of the page is cached,
+    the rows are parsed while the page downloads and the response is closed
+    as soon as the caller stops iterating (use with `contextlib.aclosing`).
+    """
+    yielded = 0
+    if page_cache.pages.peek(core.payment_history_link) is None:
+        try:
+            async with sessions.manager.client.stream(
+                "GET", core.payment_history_link, timeout=core.request_timeout
+            ) as res:
+                if auth.is_auth_failure(res):
+                    auth.state.invalidate("%s -> %s" % (core.payment_history_link, res.status_code))
+                if res.status_code == 200 and res.url == core.payment_history_link:
+                    stream = extract.HistoryStream()
+                    async for chunk in res.aiter_bytes():
+                        for row in stream.feed(chunk):
+                            yielded += 1
+                            yield row
+                        if stream.finished:
+                            return
+                    for row in stream.close():
+                        yielded += 1
+                        yield row
+                    if stream.finished:
+                        return
+                    logger.debug("Streamed history ended before #panel-1 closed, %s row(s)" % yielded)
+                else:
+                    logger.debug("Streaming history unavailable: %s (%s)" % (res.status_code, res.url))
+        except httpx.TransportError as e:
+            logger.debug("ERR_STREAM_PAYMENT_HISTORY: %s" % e)
+        finally:
+            core.save_cookies(sessions.manager.client)
+
+    # Falling back to the full (cached, retried) page, skipping rows already handed out
+    for row in extract.history_rows(await (await get_payment_history()).parsed())[yielded:]:
+        yield row
+
+async def get_error(res: httpx.Response) -> str:
+    return await extract.run(extract.errors, res.content)
 
 async def send_message(user_id: int, text: str, disable_notification: bool = False, **kwargs) -> bool:
     """
@@ -967,6 +781,15 @@ async def send_message(user_id: int, text: str, disable_notification: bool = Fal
     :param disable_notification:
     :return:
     """
+    if OUTBOX:
+        # Shard workers never talk to Telegram, the parent sends for them
+        OUTBOX.put("message", accounts.current().name, {
+            "user_id": user_id,
+            "text": text,
+            "disable_notification": disable_notification,
+            **kwargs
+        })
+        return True
     try:
         if "parse_down" not in kwargs:
             kwargs["parse_mode"] = 'Markdown'
@@ -995,117 +818,205 @@ async def send_message(user_id: int, text: str, disable_notification: bool = Fal
         return True
     return False
 
+async def deliver_message(message: records.OutgoingMessage) -> None:
+    await send_message(message.user_id, message.text, message.disable_notification, **message.options)
+
+# Shared by every account of the process, a flood wait only holds up its workers
+deliveries = pipeline.Pipeline("delivery", [
+    pipeline.Stage("deliver", deliver_message, workers=core.delivery_workers),
+])
+
+async def queue_message(user_id: int, text: str, disable_notification: bool = False, **kwargs) -> None:
+    """send_message() without waiting for Telegram, only for room in the delivery queue."""
+    if OUTBOX:
+        # Already queued to the parent, which delivers through its own pipeline
+        await send_message(user_id, text, disable_notification, **kwargs)
+        return
+    await deliveries.put(records.OutgoingMessage(user_id, text, disable_notification, kwargs))
+
+async def render_alert(stats: records.StatsDelta) -> list[records.OutgoingMessage] | None:
+    if not (processed_message := alert.format_only_change(stats, stats.period)):
+        logger.debug("No change detected!!")
+        return None
+    text = core.fix_message_format(processed_message)
+    return [records.OutgoingMessage(chat_id, text) for chat_id in core.load_chatids() or []]
+
+def make_alert_pipeline(account: accounts.Account) -> pipeline.Pipeline:
+    return pipeline.Pipeline("alerts [%s]" % account.name, [
+        pipeline.Stage("render", render_alert),
+    ], sink=lambda message: queue_message(
+        message.user_id, message.text, message.disable_notification, **message.options))
+
+# render -> delivery, one per account (the chat ids are the account's)
+alert_pipeline = accounts.Scoped("alert_pipeline", make_alert_pipeline)
+
 async def test_func():
     current_stats = await get_statistics()
     print("current_stats: ", current_stats)
-    core.chat_ids = core.load_chatids()
-    print(core.chat_ids)
+    chat_ids = core.load_chatids() or []
+    print(chat_ids)
     for period in current_stats:
         stats = current_stats[period]
         # print("processed_message: ", format_only_change(stats, period))
-        if processed_message := format_even_no_change(stats, period):
-            for chat_id in core.chat_ids:
+        if processed_message := alert.format_even_no_change(stats, period):
+            for chat_id in chat_ids:
                 print("chat_id: ", chat_id)
-                await send_message(chat_id, text=core.fix_message_format(processed_message))
+                await queue_message(chat_id, text=core.fix_message_format(processed_message))
                 # print(processed_message)
                 # print(core.fix_message_format(processed_message))
                 
+def record_statistics(account: str, stats: dict) -> None:
+    ACCOUNT_STATS[account] = {**stats, "updated": time.time()}
+
+def report_statistics(current_stats: dict[str, records.StatsDelta]) -> None:
+    if not (stats := current_stats.get("Current week")):
+        return
+    stats = {
+        "commission_current": stats.current.commission,
+        "commission_change": stats.change.commission,
+        "balance_current": stats.current.balance,
+        "deposits_current": stats.current.deposits,
+    }
+    if OUTBOX:
+        OUTBOX.put("stats", accounts.current().name, stats)
+    else:
+        record_statistics(accounts.current().name, stats)
+
+def format_totals() -> str:
+    lines = [
+        "%s: %s (%s)" % (
+            account,
+            alert.format_currency(stats["commission_current"] or 0),
+            alert.format_currency(stats["commission_change"] or 0)
+        )
+        for account, stats in sorted(ACCOUNT_STATS.items())
+    ]
+    total = sum(stats["commission_current"] or 0 for stats in ACCOUNT_STATS.values())
+    return "\n".join(["💰 *Commission (Current week)*", *lines, "", "Total: %s" % alert.format_currency(total)])
+
+async def handle_shard_message(kind: str, account: str, payload: dict) -> None:
+    if kind == "message":
+        await queue_message(**payload)
+    elif kind == "stats":
+        record_statistics(account, payload)
+
+async def rotate_on_connection_error(job: scheduling.Job, e: Exception) -> None:
+    # If there's a proxy-related error, try to get a new working proxy
+    if "proxy" in str(e).lower() or "connection" in str(e).lower():
+        logger.info("Detected proxy/connection error in %s, attempting to get new working proxy" % job.name)
+        try:
+            proxies.pool.record_failure(sessions.manager.active_proxy)
+            new_proxy = await get_rotating_proxy()
+            if new_proxy:
+                await sessions.manager.rotate(new_proxy)
+                logger.info("Successfully switched to new rotating proxy after %s error" % job.name)
+        except Exception as proxy_error:
+            logger.error(f"Failed to get new rotating proxy after {job.name} error: {proxy_error}")
+
 async def broadcast(message: types.Message = None) -> None:
     if message:
         await message.reply("Broadcast *Started!*", parse_mode='Markdown')
         logger.info("Target [%s]: BROADCAST STARTED!" % message.chat.id)
 
     current_stats = {}
-    PROCESSED = False
-    ALERT_SENT = False
     
     await test_func()
-    # return
-    while BROADCAST_EVENT.is_set():
-        # print("BROADCAST_EVENT.is_set(): ", BROADCAST_EVENT.is_set())
-        try:
-            if not PROCESSED:
-                if validate_minute(59):
-                    current_stats = await get_statistics()
-                    
-                    # Save commission data to commission.db
-                    if current_stats and "Current week" in current_stats:
-                        stats = current_stats["Current week"]
-                        commission_old = stats.get("commission_old", 0)
-                        commission_change = stats.get("commission_change", 0)
-                        commission_current = stats.get("commission_current", 0)
-                        week_change_in_commission = stats.get("week_change_in_commission", 0)
-
-                        save_commission_to_db(commission_old, commission_change, commission_current, week_change_in_commission)
-                    
-                    PROCESSED = True
-                else:
-                    continue
-            else:
-                if not isinstance(current_stats, dict) or not current_stats:
-                    current_stats = await get_statistics()
-
-            if not ALERT_SENT:
-                if validate_minute(0):
-                    ALERT_SENT = True
-                    core.chat_ids = core.load_chatids()
-                    for period in current_stats:
-                        stats = current_stats[period]
-                        if processed_message := format_only_change(stats, period):
-                            for chat_id in core.chat_ids:
-                                await send_message(chat_id, text=core.fix_message_format(processed_message))
-                        else:
-                            logger.debug("No change detected!!")
-                else:
-                    continue
+    slot = scheduling.scrape_slot()
+    logger.debug("Scrape slot [%s]: xx:%02d:%02d" % (accounts.current().name, slot // 60, slot % 60))
+
+    async def scrape() -> None:
+        nonlocal current_stats
+        # commission.db and the totals are written by the persist stage
+        current_stats = await get_statistics()
+
+    # Watch mode: figures of the last poll, and the ones the last alert reported
+    watch_schedule = scheduling.AdaptiveInterval(core.watch_floor, core.watch_ceiling)
+    watch_budget = scheduling.RequestBudget(core.watch_budget)
+    last_seen: records.StatsSnapshot = None
+    reported: records.StatsSnapshot = None
+
+    async def watch() -> None:
+        nonlocal last_seen, reported
+        if scheduler.jobs["statistics"].running:
+            return
+        if not watch_budget.spend():
+            logger.debug("Watch [%s]: hourly request budget spent" % accounts.current().name)
+            watch_schedule.observe(False)
+            return
 
-            if PROCESSED and ALERT_SENT:
-                if validate_minute(1):
-                    current_stats = {}
-                    PROCESSED = False
-                    ALERT_SENT = False
+        account_status, account_email, account_id = await perform_login()
+        stats = await process_statistics(
+            "Current week", account_status, account_email, account_id, update_db=False)
+        if stats is None:
+            watch_schedule.observe(False)
+            return
 
-        except Exception as e:
-            logger.exception("ERR_BROADCAST: %s" % e)
-            # If there's a proxy-related error, try to get a new working proxy
-            if "proxy" in str(e).lower() or "connection" in str(e).lower():
-                logger.info("Detected proxy/connection error, attempting to get new working proxy")
-                try:
-                    new_proxy = await get_rotating_proxy()
-                    if new_proxy and hasattr(core, 'session') and core.session:
-                        await core.session.aclose()
-                        transport = httpx.AsyncHTTPTransport(retries=3)
-                        core.session = httpx.AsyncClient(
-                            headers=core.base_headers,
-                            transport=transport,
-                            follow_redirects=True,
-                            proxies=new_proxy,
-                            timeout=60.0
-                        )
-                        logger.info("Successfully switched to new rotating proxy after error")
-                except Exception as proxy_error:
-                    logger.error(f"Failed to get new rotating proxy after error: {proxy_error}")
-        finally:
-            await asyncio.sleep(1)
+        current = stats.current
+        moved = last_seen is not None and any(
+            getattr(current - last_seen, name) for name in core.watch_thresholds)
+        last_seen = current
+        watch_schedule.observe(moved)
+        logger.debug("Watch [%s]: %s, next poll in %ss (%s requests left)" % (
+            accounts.current().name, moved and "moving" or "flat",
+            round(watch_schedule.seconds), watch_budget.remaining()))
+
+        reported = reported or current
+        change = records.StatsDelta(
+            stats.period, current, reported, account_status=stats.account_status,
+            account_email=stats.account_email, account_id=stats.account_id)
+        if figures := [
+            name for name, threshold in core.watch_thresholds.items()
+            if abs(getattr(change.change, name)) >= threshold
+        ]:
+            text = core.fix_message_format(alert.format_significant_change(change, figures))
+            for chat_id in core.load_chatids() or []:
+                await queue_message(chat_id, text=text)
+            reported = current
+
+    async def send_alert() -> None:
+        nonlocal current_stats, reported
+        # The hourly alert covers everything up to now, fast alerts count from here
+        reported = None
+        # The alert goes out with the scrape of this hour, even when it overran :00
+        await scheduler.idle("statistics")
+        if not isinstance(current_stats, dict) or not current_stats:
+            current_stats = await get_statistics()
+
+        # Rendered and delivered by their own stages, the next scrape does
+        # not wait for Telegram
+        for stats in current_stats.values():
+            await alert_pipeline.put(stats)
+        current_stats = {}
+
+    jobs = [
+        scheduling.Job("statistics", scrape, scheduling.scrape_schedule()),
+        scheduling.Job("alert", send_alert, scheduling.alert_schedule()),
+    ]
+    if core.watch_statistics:
+        jobs.append(scheduling.Job("watch", watch, watch_schedule))
+    scheduler = scheduling.Scheduler(jobs, store=core.store.instance(), on_error=rotate_on_connection_error)
+    await scheduler.run(BROADCAST_EVENT.is_set)
 
 async def verify_payment(amount: int | float, res: httpx.Response = None, failsafe: bool = False) -> bool:
     try:
         if res is None:
-            res = await fetch(url=core.payment_history_link)
+            page = await get_payment_history(fresh=failsafe)
+            res = page.response
             logger.debug("Response: %s | %s" % (
                 res.status_code, res.url
             ))
+        else:
+            page = page_cache.CachedPage(res, parse=parse_html)
 
-        data_h = bs(res.text, "lxml")
+        data_h = await page.parsed()
         # Look for all amount cells and check the most recent ones
-        amount_cells = data_h.select('#panel-1 td[data-label="Amount, $"]')
+        amount_cells = [row.amount for row in extract.history_rows(data_h)]
         
         if amount_cells:
             # Check the first few rows (most recent withdrawals)
-            for i, td in enumerate(amount_cells[:3]):  # Check first 3 rows
-                td_value = td.text.replace("$", "").replace("'", "").replace(",", "").strip()
+            for i, td_value in enumerate(amount_cells[:3]):  # Check first 3 rows
                 try:
-                    td_value = int(float(td_value)) if isinstance(amount, int) else float(td_value)
+                    td_value = int(td_value) if isinstance(amount, int) else float(td_value)
                     # Use tolerance for float comparison to handle rounding issues
                     if isinstance(amount, float) and isinstance(td_value, float):
                         if abs(td_value - amount) < 0.01:  # Allow 1 cent tolerance
@@ -1143,11 +1054,11 @@ async def verify_payment(amount: int | float, res: httpx.Response = None, failsa
 async def verify_payment_tmp(amount: int | float, res, failsafe: bool = False) -> bool:
     try:
 
-        data_h = bs(res, "lxml")
-        if td := data_h.select_one('#panel-1 td[data-label="Amount, $"]'):
-            td_value = td.text.replace("$", "").replace("'", "").replace(",", "").strip()
+        rows = extract.history_rows(await extract.parse_async(res))
+        if rows:
+            td_value = rows[0].amount
             try:
-                td_value = int(float(td_value)) if isinstance(amount, int) else float(td_value)
+                td_value = int(td_value) if isinstance(amount, int) else float(td_value)
                 if td_value == amount:
                     logger.debug(
                         "PROCESS_WITHDRAWAL_VERIFICATION -> SUCCESS -> %s" % amount)
@@ -1182,21 +1093,18 @@ async def process_withdrawal(_type: str, amount: int | float) -> bool:
             timeout=30.0
         )
         
-        try:
-            with open("withdrawal_request_1.html", "wb") as f:
-                f.write(res_r.content)
-        except:
-            pass
+        captures.buffer.record("payment_request", res_r)
         
         # Check if the response content indicates unauthorized access
         if b"Unauthenticated" in res_r.content or b"error" in res_r.content:
             core.delete_cookies()
+            auth.state.invalidate("payment request page")
 
         payment_payload = generate_payment_payload(
-            data=bs(res_r.text, "lxml"), _type=_type, balance=amount
+            data=await extract.parse_async(res_r.content), _type=_type, balance=amount
         )
         # print("payment_payload: ", payment_payload)
-        res_post_r = await core.session.post(
+        res_post_r = await sessions.manager.client.post(
             url=core.payment_request_link,
             data=payment_payload,
             headers=payment_headers,
@@ -1205,25 +1113,31 @@ async def process_withdrawal(_type: str, amount: int | float) -> bool:
         logger.debug("Response: %s | %s" % (
             res_post_r.status_code, res_post_r.url
         ))
+        if auth.is_auth_failure(res_post_r):
+            auth.state.invalidate("payment request post")
         
-        try:
-            with open("withdrawal_request.html", "wb") as f:
-                f.write(res_post_r.content)
-        except:
-            pass
-
+        captures.buffer.record("payment_request_post", res_post_r)
         
+        # The POST redirects to the fresh history page, sharing it with the next readers
+        page_cache.pages.invalidate(core.payment_history_link)
         if res_post_r.url == core.payment_history_link:
-            return await verify_payment(
-                amount=amount, res=res_post_r
+            page_cache.pages.put(
+                core.payment_history_link,
+                page_cache.CachedPage(res_post_r, parse=parse_html)
             )
+            # Verified against the page cached above
+            if await verify_payment(amount=amount):
+                return True
+            await captures.buffer.export_async("withdrawal_unverified")
+            return False
         else:
-            error = get_error(res_post_r)
+            error = await get_error(res_post_r)
             logger.debug(
                 "WARN_PROCESS_WITHDRAWAL: %s (%s) (%s) (%s) -> %s" % (
                     res_post_r.status_code, res_post_r.url,
                     str(payment_payload), _type, error
                 ))
+            await captures.buffer.export_async("withdrawal_failed")
             return False
 
     except Exception as e:
@@ -1231,23 +1145,20 @@ async def process_withdrawal(_type: str, amount: int | float) -> bool:
             "ERR_PROCESS_WITHDRAWAL: %s (%s) (%s) | %s" %
             (_type, amount, str(payment_payload), e)
         )
+        await captures.buffer.export_async("withdrawal_error")
         return False
 
 async def get_wallet_str(amount: float) -> str:
     wallet_info = ""
     try:
-        res = await fetch(core.payment_history_link)
-        data = bs(res.text, "lxml")
-        for tr in data.select("#panel-1 tr"):
-            if not tr.select_one("td"):
-                continue
-            if td_element := tr.select_one('td[data-label="Amount, $"]'):
-                amount_str = td_element.text.replace("$", "").replace(",", "").strip()
+        data = await (await get_payment_history()).parsed()
+        for row in extract.history_rows(data):
+            if td_element := row.amount_text:
+                amount_str = td_element.replace(",", "")
                 # print("amount_str: ", amount_str)
                 # print("amount: ", amount)
                 if str(amount) in amount_str:
-                    wallet_info = tr.select_one(
-                        '[data-label="Payment method"]').text.strip()
+                    wallet_info = row.method
                     break
         # print("wallet_info: ", wallet_info)
     except Exception as e:
@@ -1255,26 +1166,18 @@ async def get_wallet_str(amount: float) -> str:
 
     return wallet_info
 
-async def get_latest_payment_requests(last_request_id: str) -> list[str, list[dict]]:
-    records = []
+async def get_latest_payment_requests(last_request_id: str) -> tuple[str, list[records.PaymentRow]]:
+    new_requests = []
     new_request_id = last_request_id
     try:
-        res = await fetch(core.payment_history_link)
-        data = bs(res.text, "lxml")
-        # print("data: ", data)
-        for tr in data.select("#panel-1 tr"):
-            if not tr.select_one("td"):
-                continue
-
-            if id_element := tr.select_one('[data-label="ID"]'):
-                if id_element.text.strip() == last_request_id:
-                    break
+        # Only the rows above the last known request are read
+        async with contextlib.aclosing(iter_payment_history()) as rows:
+            async for row in rows:
+                if row.id:
+                    if row.id == last_request_id:
+                        break
 
-                records.append({
-                    "ID": tr.select_one('[data-label="ID"]').text.strip(),
-                    "Amount, $": tr.select_one('[data-label="Amount, $"]').text.replace("$", "").strip(),
-                    "Payment method": tr.select_one('[data-label="Payment method"]').text.strip(),
-                })
+                    new_requests.append(row)
 
     except Exception as e:
         logger.exception(
@@ -1282,18 +1185,20 @@ async def get_latest_payment_requests(last_request_id: str) -> list[str, list[di
             last_request_id
         )
 
-    if records:
-        new_request_id = records[0]["ID"]
+    if new_requests:
+        new_request_id = new_requests[0].id
 
-    return new_request_id, records
+    return new_request_id, new_requests
 
 async def get_last_payment_request_id() -> str:
     request_id = ""
     try:
-        res = await fetch(core.payment_history_link)
-        data = bs(res.text, "lxml")
-        if id_element := data.select_one('#panel-1 tr td[data-label="ID"]'):
-            request_id = id_element.text.strip()
+        # Only the first row is read
+        async with contextlib.aclosing(iter_payment_history()) as rows:
+            async for row in rows:
+                if row.id:
+                    request_id = row.id
+                    break
 
     except Exception as e:
         logger.exception("ERR_GET_LAST_PAYMENT_REQUEST_ID")
@@ -1301,8 +1206,7 @@ async def get_last_payment_request_id() -> str:
     return request_id
 
 def save_withdrawal_message(message: str) -> None:
-    with open("last_withdrawal_message.txt", "w", encoding="utf-8") as f:
-        f.write(message)
+    core.save_withdrawal_receipt(message)
     try:
         logger.debug(message)
     except Exception as e:
@@ -1313,16 +1217,16 @@ async def monitor_test(history_obj):
     # print("new_request_id: ", new_request_id)
     if history_obj.request_id and new_requests:
         for request in new_requests:
-            print(request["Amount, $"])
+            print(request.amount_text)
             processed_message = format_withdrawal(
                 _type="---",
-                amount=request["Amount, $"],
+                amount=request.amount_text,
                 mode="Manual",
-                wallet_str=request["Payment method"]
+                wallet_str=request.method
             )
             # print("fixed_message: ", core.fix_message_format(processed_message))
-            core.chat_ids = core.load_chatids()
-            for chat_id in core.chat_ids:
+            chat_ids = core.load_chatids() or []
+            for chat_id in chat_ids:
                 await send_message(
                     chat_id,
                     text=core.fix_message_format(
@@ -1343,7 +1247,7 @@ async def monitor_test(history_obj):
     current_stats = await process_statistics(period="Current week", update_db=False)
     print("current_stats: ", current_stats)
     for key in ["Balance", "Bonus"]:
-        amount = current_stats.get("%s_current" % key.lower())
+        amount = current_stats and getattr(current_stats.current, key.lower())
         # if not amount or int(amount) < 11:
         if not amount or int(amount) < MIN_WITHDRAWAL_AMOUNT:
             logger.debug("%s -> %s -> Not enough for Withdrawal" % (
@@ -1363,7 +1267,7 @@ async def monitor_test(history_obj):
         #         wallet_str=await get_wallet_str(amount)
         #     )
         #     core.chat_ids = core.load_chatids()
-        #     for chat_id in core.chat_ids:
+        #     for chat_id in chat_ids:
         #         await send_message(
         #             chat_id,
         #             text=core.fix_message_format(
@@ -1376,16 +1280,8 @@ async def monitor_test(history_obj):
     # else:
     #     logger.debug("Auto-Withdrawal is currently off!!")
 
-async def monitor_withdrawal(message: types.Message = None) -> None:
-    global WITHDRAWAL_AMOUNT, WITHDRAWAL_INTERVAL
-
-    if message:
-        await message.reply("Withdrawal Process *Started!*", parse_mode='Markdown')
-        logger.info("Target [%s]: WITHDRAWAL PROCESS STARTED!" %
-                    message.chat.id)
-
-    PROCESSED = False
-    history_obj: models.History = await models.History.first()
+async def load_history() -> models.History:
+    history_obj: models.History = await models.History.filter(account=models.current_account()).first()
     
     # print("history_obj", history_obj)
     if history_obj is None:
@@ -1393,133 +1289,131 @@ async def monitor_withdrawal(message: types.Message = None) -> None:
             "request_id": None
         })
         await history_obj.save()
+    return history_obj
+
+async def withdrawal_cycle(history_obj: models.History) -> None:
+    """One pass of the withdrawal monitor: new manual requests, then auto-withdrawal."""
+    # History Check
+    new_request_id, new_requests = await get_latest_payment_requests(history_obj.request_id)
+
+    if history_obj.request_id and new_requests:
+        for request in new_requests:
+            processed_message = format_withdrawal(
+                _type="---",
+                amount=request.amount_text,
+                mode="Manual",
+                wallet_str=request.method
+            )
+            chat_ids = core.load_chatids() or []
+            for chat_id in chat_ids:
+                await send_message(
+                    chat_id,
+                    text=core.fix_message_format(
+                        processed_message)
+                )
+            try:
+                logger.debug(processed_message)
+            except:
+                print(processed_message)
+
+    logger.debug("First Check -> Latest ID: %s | Existing ID: %s" % (
+        new_request_id, history_obj.request_id
+    ))
+    if new_request_id and history_obj.request_id != new_request_id:
+        history_obj.request_id = new_request_id
+        await history_obj.save()
+
+    flag = await models.is_auto_withdrawal_active()
+    print("Flag================>", flag)
+    # Auto-Withdrawal Check
+    if flag:
+        # Locals, the module globals are shared by every account of the process
+        withdrawal_amount, withdrawal_interval = await models.get_withdrawal_settings()
+        print("WITHDRAWAL_AMOUNT: ", withdrawal_amount)
+        print("WITHDRAWAL_INTERVAL: ", withdrawal_interval)
+        current_stats = await process_statistics(period="Current week", update_db=False)
+        print("current_stats: ", current_stats)
+        for key in ["Balance", "Bonus"]:
+            amount = current_stats and getattr(current_stats.current, key.lower())
+            # if not amount or int(amount) < 11:
+            if not amount or int(amount) < MIN_WITHDRAWAL_AMOUNT:
+                logger.debug("%s -> %s -> Not enough for Withdrawal" % (
+                    key, str(amount)
+                ))
+                continue
+
+            amount -= 1
+            amount = min(withdrawal_amount, amount)
+
+            payment_status = await process_withdrawal(_type=key, amount=amount)
+            if payment_status:
+                processed_message = format_withdrawal(
+                    _type=key,
+                    amount=amount,
+                    mode="Bot",
+                    wallet_str=await get_wallet_str(amount)
+                )
+                chat_ids = core.load_chatids() or []
+                for chat_id in chat_ids:
+                    await send_message(
+                        chat_id,
+                        text=core.fix_message_format(
+                            processed_message)
+                    )
+                save_withdrawal_message(processed_message)
+            else:
+                for chat_id in core.load_chatids() or []:
+                    await send_message(
+                        chat_id,
+                        text=f"Trying to withdraw ${amount}.\nBut you have already exceeded the daily withdrawal limit of 2."
+                        # text=f"Withdrawal request for ${amount} ({key}) was submitted but verification failed.\nPlease check your payment history manually."
+                    )
+                logger.debug(
+                    "Auto-Withdrawal request for $%s (%s) failed verification!!" % (amount, key))
+    else:
+        logger.debug("Auto-Withdrawal is currently off!!")
+
+    # Updating the last payment request id
+    latest_request_id = await get_last_payment_request_id()
+    logger.debug("Second Check -> Latest ID: %s | Existing ID: %s" % (
+        latest_request_id, history_obj.request_id
+    ))
+    if latest_request_id:
+        if history_obj.request_id != latest_request_id:
+            history_obj.request_id = latest_request_id
+            await history_obj.save()
+
+async def withdrawal_schedule() -> scheduling.Interval:
+    # Re-read every time, /autowithdrawal can change the interval (settings are cached)
+    _, interval = await models.get_withdrawal_settings() or (None, None)
+    return scheduling.withdrawal_schedule(interval or WITHDRAWAL_INTERVAL)
+
+async def monitor_withdrawal(message: types.Message = None) -> None:
+    if message:
+        await message.reply("Withdrawal Process *Started!*", parse_mode='Markdown')
+        logger.info("Target [%s]: WITHDRAWAL PROCESS STARTED!" %
+                    message.chat.id)
+
+    history_obj = await load_history()
 
     logger.debug("Payout Last Request ID: %s" % history_obj.request_id)
 
     # await monitor_test(history_obj)
     # return
-    while WITHDRAWAL_EVENT.is_set():
-        # print("models.is_auto_withdrawal_active(): ", await models.is_auto_withdrawal_active())
-        # print("validate_minute_withdrawal(): ", validate_minute_withdrawal())
-        try:
-            if not PROCESSED:
-                if await validate_minute_withdrawal():
-                    PROCESSED = True
-                    # History Check
-                    new_request_id, new_requests = await get_latest_payment_requests(history_obj.request_id)
-
-                    if history_obj.request_id and new_requests:
-                        for request in new_requests:
-                            processed_message = format_withdrawal(
-                                _type="---",
-                                amount=request["Amount, $"],
-                                mode="Manual",
-                                wallet_str=request["Payment method"]
-                            )
-                            core.chat_ids = core.load_chatids()
-                            for chat_id in core.chat_ids:
-                                await send_message(
-                                    chat_id,
-                                    text=core.fix_message_format(
-                                        processed_message)
-                                )
-                            try:
-                                logger.debug(processed_message)
-                            except:
-                                print(processed_message)
-
-                    logger.debug("First Check -> Latest ID: %s | Existing ID: %s" % (
-                        new_request_id, history_obj.request_id
-                    ))
-                    if new_request_id and history_obj.request_id != new_request_id:
-                        history_obj.request_id = new_request_id
-                        await history_obj.save()
-
-                    flag = await models.is_auto_withdrawal_active()
-                    print("Flag================>", flag)
-                    # Auto-Withdrawal Check
-                    if await models.is_auto_withdrawal_active():
-                        WITHDRAWAL_AMOUNT, WITHDRAWAL_INTERVAL = await models.get_withdrawal_settings()
-                        print("WITHDRAWAL_AMOUNT: ", WITHDRAWAL_AMOUNT)
-                        print("WITHDRAWAL_INTERVAL: ", WITHDRAWAL_INTERVAL)
-                        current_stats = await process_statistics(period="Current week", update_db=False)
-                        print("current_stats: ", current_stats)
-                        for key in ["Balance", "Bonus"]:
-                            amount = current_stats.get("%s_current" % key.lower())
-                            # if not amount or int(amount) < 11:
-                            if not amount or int(amount) < MIN_WITHDRAWAL_AMOUNT:
-                                logger.debug("%s -> %s -> Not enough for Withdrawal" % (
-                                    key, str(amount)
-                                ))
-                                continue
-
-                            amount -= 1
-                            amount = min(WITHDRAWAL_AMOUNT, amount)
-
-                            payment_status = await process_withdrawal(_type=key, amount=amount)
-                            if payment_status:
-                                processed_message = format_withdrawal(
-                                    _type=key,
-                                    amount=amount,
-                                    mode="Bot",
-                                    wallet_str=await get_wallet_str(amount)
-                                )
-                                core.chat_ids = core.load_chatids()
-                                for chat_id in core.chat_ids:
-                                    await send_message(
-                                        chat_id,
-                                        text=core.fix_message_format(
-                                            processed_message)
-                                    )
-                                save_withdrawal_message(processed_message)
-                            else:
-                                for chat_id in core.chat_ids:
-                                    await send_message(
-                                        chat_id,
-                                        text=f"Trying to withdraw ${amount}.\nBut you have already exceeded the daily withdrawal limit of 2."
-                                        # text=f"Withdrawal request for ${amount} ({key}) was submitted but verification failed.\nPlease check your payment history manually."
-                                    )
-                                logger.debug(
-                                    "Auto-Withdrawal request for $%s (%s) failed verification!!" % (amount, key))
-                    else:
-                        logger.debug("Auto-Withdrawal is currently off!!")
-
-                    # Updating the last payment request id
-                    latest_request_id = await get_last_payment_request_id()
-                    logger.debug("Second Check -> Latest ID: %s | Existing ID: %s" % (
-                        latest_request_id, history_obj.request_id
-                    ))
-                    if latest_request_id:
-                        if history_obj.request_id != latest_request_id:
-                            history_obj.request_id = latest_request_id
-                            await history_obj.save()
-
-            if PROCESSED and not await validate_minute_withdrawal():
-                PROCESSED = False
+    scheduler = scheduling.Scheduler([
+        scheduling.Job("withdrawal", lambda: withdrawal_cycle(history_obj), withdrawal_schedule),
+    ], store=core.store.instance(), on_error=rotate_on_connection_error)
+    await scheduler.run(WITHDRAWAL_EVENT.is_set)
 
-        except Exception as e:
-            logger.exception("ERR_MONITOR_WITHDRAWAL: %s" % e)
-            # If there's a proxy-related error, try to get a new working proxy
-            if "proxy" in str(e).lower() or "connection" in str(e).lower():
-                logger.info("Detected proxy/connection error in withdrawal monitor, attempting to get new working proxy")
-                try:
-                    new_proxy = await get_rotating_proxy()
-                    if new_proxy and hasattr(core, 'session') and core.session:
-                        await core.session.aclose()
-                        transport = httpx.AsyncHTTPTransport(retries=3)
-                        core.session = httpx.AsyncClient(
-                            headers=core.base_headers,
-                            transport=transport,
-                            follow_redirects=True,
-                            proxies=new_proxy,
-                            timeout=60.0
-                        )
-                        logger.info("Successfully switched to new rotating proxy after withdrawal monitor error")
-                except Exception as proxy_error:
-                    logger.error(f"Failed to get new rotating proxy after withdrawal monitor error: {proxy_error}")
-        finally:
-            await asyncio.sleep(1)
 
+# Every account running in this process, see accounts.py
+ACCOUNTS: list[accounts.Account] = accounts.load_accounts(core.accounts_path, core.config)
+
+@dp.message.outer_middleware()
+async def account_middleware(handler, event: Message, data: dict):
+    # Commands act on the account whose chat_ids.txt lists the chat
+    accounts.activate(accounts.for_chat(ACCOUNTS, event.chat.id, core.load_chatids))
+    return await handler(event, data)
 
 @dp.message(Command('help'))
 async def help_command(message: Message) -> None:
@@ -1533,9 +1427,9 @@ async def start_command(message: Message) -> None:
     if BROADCAST_EVENT.is_set():
         await message.reply("Broadcast is already running!!")
     else:
+        # Every account's broadcast task picks its job up again, see resume_on
         BROADCAST_EVENT.set()
         await message.reply("Broadcast has been started!!")
-        await broadcast()
 
 @dp.message(Command('stop'))
 async def stop_command(message: Message) -> None:
@@ -1548,15 +1442,25 @@ async def stop_command(message: Message) -> None:
 
 @dp.message(Command('check_withdrawal'))
 async def check_withdrawal_command(message: Message) -> None:
-    
+    # With shards the parent never logged in, the session is opened here on first use
+    try:
+        account_status, account_email, account_id = await perform_login()
+    except Exception as e:
+        logger.exception("ERR_CHECK_WITHDRAWAL_LOGIN: %s" % e)
+        await message.reply("Could not log in to check the withdrawal, try again later!!")
+        return
+
     stats = await process_statistics(
         period="Current week",
+        account_status=account_status,
+        account_email=account_email,
+        account_id=account_id,
         update_db=False
     )
 
-    if balance := validate_amount(stats.get("balance_current")):
+    if balance := stats and validate_amount(stats.current.balance):
         await message.reply("Balance is available for withdrawal: $%s" % balance)
-    elif bonus := validate_amount(stats.get("bonus_current")):
+    elif bonus := stats and validate_amount(stats.current.bonus):
         await message.reply("Bonus is available for withdrawal: $%s" % bonus)
     else:
         await message.reply("Withdrawal is not possible at the moment!!")
@@ -1643,6 +1547,31 @@ async def autowithdrawal_command(message: Message, command: CommandObject) -> No
     else:
         await message.reply("Invalid number of arguments. Use either:\n1. 'on' or 'off'\n2. 'amount period' (e.g. '100 1440' or 'all 1440')")
 
+@dp.message(Command('totals'))
+async def totals_command(message: Message) -> None:
+    if not ACCOUNT_STATS:
+        await message.reply("No statistics collected yet!!")
+        return
+    await message.reply(core.fix_message_format(format_totals()), parse_mode=ParseMode.MARKDOWN)
+
+@dp.message(Command('captures'))
+async def captures_command(message: Message) -> None:
+    if path := await captures.buffer.export_async("command"):
+        await message.reply("Debug captures exported: %s" % path.name)
+    else:
+        await message.reply("No debug captures recorded yet!!")
+
+@dp.message(Command('proxies'))
+async def proxies_command(message: Message) -> None:
+    await message.reply("\n".join([
+        "%s | latency: %ss | success: %s%% | requests: %s | failures: %s%s" % (
+            item["proxy"], item["latency"], round(item["success_rate"] * 100),
+            item["requests"], item["failures"],
+            item["quarantined"] and " | quarantined" or ""
+        )
+        for item in proxies.pool.stats()
+    ]))
+
 async def check_anticaptcha_key() -> bool:
     """Check if the Anti-Captcha API key is valid and has sufficient balance."""
     try:
@@ -1654,49 +1583,146 @@ async def check_anticaptcha_key() -> bool:
         logger.error(f"Invalid Anti-Captcha API key: {str(e)}")
         return False
 
-if __name__ == "__main__":
-    async def run_background_task(coro, name):
-        try:
-            await coro
-        except asyncio.CancelledError:
-            logger.info(f"{name} task was cancelled")
-        except Exception as e:
-            logger.exception(f"Error in {name} task: {e}")
+async def run_background_task(coro, name):
+    try:
+        await coro
+    except asyncio.CancelledError:
+        logger.info(f"{name} task was cancelled")
+    except Exception as e:
+        logger.exception(f"Error in {name} task: {e}")
+
+async def resume_on(event, job) -> None:
+    # /stop ends the job of every account, each one picks it up again once /start sets the event
+    while True:
+        if event.is_set():
+            await job()
+        await asyncio.sleep(1)
+
+def start_account_tasks(account_list: list[accounts.Account]) -> list[asyncio.Task]:
+    tasks = []
+    for account in account_list:
+        for name, job in [
+            # Resolved once the account is active inside its task
+            ("state flusher", lambda: core.store.run_flusher()),
+            ("broadcast", lambda: resume_on(BROADCAST_EVENT, broadcast)),
+            ("monitor", lambda: resume_on(WITHDRAWAL_EVENT, monitor_withdrawal)),
+        ]:
+            tasks.append(asyncio.create_task(
+                run_background_task(accounts.run_as(account, job), "%s [%s]" % (name, account.name)),
+                name="%s-%s" % (name, account.name)
+            ))
+    return tasks
+
+async def close_accounts(account_list: list[accounts.Account]) -> None:
+    for account in account_list:
+        accounts.activate(account)
+        await statistics_pipeline.stop()
+        await alert_pipeline.stop(drain_timeout=10)
+        await sessions.manager.aclose()
+        captcha.tokens.disarm()
+        core.store.flush()
+    # Alerts already rendered still get a chance to go out
+    await deliveries.stop(drain_timeout=10)
+    captcha.executor.shutdown(wait=False, cancel_futures=True)
+    extract.shutdown()
+    await db_close()
+
+async def shard_main(account_list: list[accounts.Account], stopping) -> None:
+    try:
+        # The parent already migrated the database
+        await db_connect()
+
+        await gather_bounded(*(
+            accounts.run_as(account, perform_login) for account in account_list
+        ))
+        tasks = start_account_tasks(account_list)
+
+        while not stopping.is_set():
+            await asyncio.sleep(1)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    except Exception as e:
+        logger.exception(f"Shard loop error: {e}")
+        # A non-zero exit code gets the shard restarted by the supervisor
+        raise
+    finally:
+        await close_accounts(account_list)
+
+def run_shard(shard: int, shard_count: int, outbox: shards.Outbox, events: dict) -> None:
+    """Entry point of a shard worker process, runs the accounts assigned to it."""
+    global OUTBOX, BROADCAST_EVENT, WITHDRAWAL_EVENT
+    OUTBOX = outbox
+    BROADCAST_EVENT = events["broadcast"]
+    WITHDRAWAL_EVENT = events["withdrawal"]
+
+    account_list = shards.assign(ACCOUNTS, shard_count)[shard]
+    logger.debug("======== Shard %s/%s (%s) ========" % (
+        shard, shard_count, ", ".join(account.name for account in account_list) or "idle"))
+    if not account_list:
+        return
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(shard_main(account_list, events["stopping"]))
 
+if __name__ == "__main__":
     async def main():
+        global BROADCAST_EVENT, WITHDRAWAL_EVENT
+        supervisor = None
+        tasks = []
         try:
             if sys.platform == 'win32':
                 # Set up Windows-specific event loop policy
                 asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
             
-            await db_init()
-            logger.debug("======== New Session ========")
+            await db_init(ACCOUNTS)
+            logger.debug("======== New Session (%s accounts) ========" % len(ACCOUNTS))
 
             if not await check_anticaptcha_key():
                 logger.error("Invalid or insufficient balance on Anti-Captcha API key")
                 return
 
-            # Initialize with working proxy
-            await perform_login()
+            if core.shard_count > 1:
+                # The accounts run in worker processes, this one only polls
+                # Telegram, sends the alerts and keeps the totals
+                supervisor = shards.ShardSupervisor(run_shard, core.shard_count, {
+                    "broadcast": BROADCAST_EVENT,
+                    "withdrawal": WITHDRAWAL_EVENT,
+                    "stopping": Event(),
+                })
+                BROADCAST_EVENT = supervisor.events["broadcast"]
+                WITHDRAWAL_EVENT = supervisor.events["withdrawal"]
+                supervisor.start()
+                tasks = [
+                    asyncio.create_task(run_background_task(supervisor.supervise(), "shard supervisor")),
+                    asyncio.create_task(run_background_task(supervisor.drain(handle_shard_message), "shard outbox")),
+                ]
+            else:
+                # Initialize every account with working proxy
+                await gather_bounded(*(
+                    accounts.run_as(account, perform_login) for account in ACCOUNTS
+                ))
 
-            broadcast_task = asyncio.create_task(run_background_task(broadcast(), "broadcast"), name="broadcast")
-            monitor_task = asyncio.create_task(run_background_task(monitor_withdrawal(), "monitor"), name="monitor")
+                # One event loop, bot and scheduler for every account
+                tasks = start_account_tasks(ACCOUNTS)
             
             await dp.start_polling(bot)
             
-            broadcast_task.cancel()
-            monitor_task.cancel()
+            for task in tasks:
+                task.cancel()
             
             # Wait for tasks to finish
-            await asyncio.gather(broadcast_task, monitor_task, return_exceptions=True)
+            await asyncio.gather(*tasks, return_exceptions=True)
             
         except Exception as e:
             logger.exception(f"Main loop error: {e}")
         finally:
             # Cleanup resources
-            if hasattr(core, 'session') and core.session:
-                await core.session.aclose()
-            await db_close()
+            if supervisor:
+                await asyncio.to_thread(supervisor.stop)
+            await close_accounts(ACCOUNTS)
 
     # Run with proper asyncio handling
     if sys.platform == 'win32':
@@ -0,0 +1,262 @@
+"""
+In-process stand-in for pocketpartners.com, served through
+`httpx.MockTransport` (plug it in with `sessions.upstream = site.transport()`).
+
+It answers the routes main.py uses: the login and OTP API, the dashboard,
+the brief statistics JSON, the ratings page and the payments request /
+history pages (a withdrawal POST redirects to the history, like the real
+site). The HTML is built from the committed captures, so page sizes and
+parse costs match production. Latency, error rate and session lifetime
+are configurable, every route keeps request and byte counters.
+"""
+import asyncio
+import json
+import random
+import re
+import secrets
+import time
+from dataclasses import dataclass, field
+from html import escape
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import httpx
+import pyotp
+
+HOST = "pocketpartners.com"
+SESSION_COOKIE = "pocketpartners_session"
+
+fixtures_path = Path(__file__).parent
+
+
+@dataclass(slots=True)
+class RouteStats:
+    requests: int = 0
+    errors: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+
+
+@dataclass
+class MockStats:
+    routes: dict[str, RouteStats] = field(default_factory=dict)
+
+    def route(self, name: str) -> RouteStats:
+        if name not in self.routes:
+            self.routes[name] = RouteStats()
+        return self.routes[name]
+
+    def total(self) -> RouteStats:
+        total = RouteStats()
+        for stats in self.routes.values():
+            total.requests += stats.requests
+            total.errors += stats.errors
+            total.bytes_in += stats.bytes_in
+            total.bytes_out += stats.bytes_out
+        return total
+
+    def reset(self) -> None:
+        self.routes.clear()
+
+
+class CountedBody(httpx.AsyncByteStream):
+    """Response body sent in chunks, only the chunks actually read are counted."""
+
+    def __init__(self, content: bytes, stats: RouteStats, chunk_size: int) -> None:
+        self.content = content
+        self.stats = stats
+        self.chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for start in range(0, len(self.content), self.chunk_size):
+            chunk = self.content[start:start + self.chunk_size]
+            self.stats.bytes_out += len(chunk)
+            yield chunk
+
+
+class MockPocketPartners:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.2, error_rate: float = 0.0,
+                 session_ttl: float = None, otp_secret: str = None, history_size: int = 50,
+                 chunk_size: int = 16 * 1024, seed: int = None) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.session_ttl = session_ttl
+        self.otp_secret = otp_secret
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.stats = MockStats()
+
+        # token -> expiry (monotonic), None never expires
+        self.sessions: dict[str, float | None] = {}
+        self.csrf_token = secrets.token_urlsafe(30)
+
+        self.figures = {
+            "clicks": 5820, "regs": 412, "count_ftd": 97,
+            "sum_depo": 12480.55, "sum_commission": 3120.14, "sum_wdrl": 8200.0,
+            "balance": 1843.2, "bonus": 25.0,
+        }
+        self.dashboard_page = fixtures_path.joinpath("response.html").read_bytes()
+        # The form token of the capture swapped for the one the mock checks
+        self.request_page = re.sub(
+            rb'(name="_token" value=")[^"]*', rb"\g<1>" + self.csrf_token.encode(),
+            fixtures_path.joinpath("withdrawal_request_1.html").read_bytes(), count=1
+        )
+        self.history_head, self.history_tail = self._split_history(
+            fixtures_path.joinpath("withdrawal_request.html").read_text(encoding="utf-8"))
+        self.payments = [
+            {"id": 281316 - number * 193, "amount": round(100 + number * 7.31, 2),
+             "created": "2025-09-%02d 00:15:26" % max(17 - number // 3, 1)}
+            for number in range(history_size)
+        ]
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def expire_sessions(self) -> None:
+        self.sessions.clear()
+
+    # Pages
+
+    @staticmethod
+    def _split_history(page: str) -> tuple[bytes, bytes]:
+        # Keeping the real page around the rows of #panel-1
+        panel = page.index('id="panel-1"')
+        body_start = page.index("<tbody>", panel) + len("<tbody>")
+        body_end = page.index("</tbody>", body_start)
+        return page[:body_start].encode(), page[body_end:].encode()
+
+    def history_page(self) -> bytes:
+        rows = "".join(
+            '<tr><td data-label="ID">%s</td><td data-label="Date of creation">%s</td>'
+            '<td data-label="Date of update">%s</td><td class="text-right" data-label="Amount, $">'
+            '$%s</td><td data-label="Payment method">Tether TRC20: TXaCWJLstNTGBdGj9oCcBMSYF2pQDnfrJX'
+            '</td><td data-label="Status">New</td></tr>\n' % (
+                payment["id"], payment["created"], payment["created"], "{:,.2f}".format(payment["amount"]))
+            for payment in self.payments
+        )
+        return self.history_head + rows.encode() + self.history_tail
+
+    def login_page(self) -> bytes:
+        return (
+            '<html><body><form method="post" action="/en/api/login">'
+            '<input type="hidden" name="_token" value="%s">'
+            '<input name="email"><input name="password" type="password"></form></body></html>'
+            % escape(self.csrf_token)
+        ).encode()
+
+    def ratings_page(self) -> bytes:
+        return (
+            '<html><body><table><tr><th>#</th><th>Sum of deposits</th></tr>'
+            '<tr><td data-label="#">6</td><td data-label="Sum of deposits">$15,002.10</td></tr>'
+            '<tr class="bg-info-50"><td data-label="#">7</td>'
+            '<td data-label="Sum of deposits">$%s</td></tr></table></body></html>'
+            % "{:,.2f}".format(self.figures["sum_depo"])
+        ).encode()
+
+    def statistics(self) -> dict:
+        # A little activity between polls
+        if self.random.random() < 0.5:
+            deposit = round(self.random.uniform(10, 250), 2)
+            self.figures["sum_depo"] = round(self.figures["sum_depo"] + deposit, 2)
+            self.figures["sum_commission"] = round(self.figures["sum_commission"] + deposit * 0.5, 2)
+            self.figures["balance"] = round(self.figures["balance"] + deposit * 0.5, 2)
+            self.figures["clicks"] += self.random.randint(0, 20)
+        return {key: str(value) if isinstance(value, float) else value for key, value in self.figures.items()}
+
+    # Requests
+
+    def session_of(self, request: httpx.Request) -> str | None:
+        if match := re.search(r"%s=([^;]+)" % SESSION_COOKIE, request.headers.get("cookie", "")):
+            token = match.group(1)
+            if token in self.sessions:
+                expires_at = self.sessions[token]
+                if expires_at is None or time.monotonic() < expires_at:
+                    return token
+                del self.sessions[token]
+        return None
+
+    def new_session(self) -> str:
+        token = secrets.token_hex(16)
+        self.sessions[token] = self.session_ttl and time.monotonic() + self.session_ttl or None
+        return token
+
+    def respond(self, route: RouteStats, status_code: int, content: bytes = b"",
+                headers: dict = None, json_body=None) -> httpx.Response:
+        if json_body is not None:
+            # Compact like Laravel's, main.py looks for '"is2FA":true'
+            content = json.dumps(json_body, separators=(",", ":")).encode()
+            headers = {**(headers or {}), "content-type": "application/json"}
+        elif content:
+            headers = {"content-type": "text/html; charset=UTF-8", **(headers or {})}
+        return httpx.Response(
+            status_code, headers=headers,
+            stream=CountedBody(content, route, self.chunk_size)
+        )
+
+    def redirect(self, route: RouteStats, path: str, headers: dict = None) -> httpx.Response:
+        return self.respond(route, 302, headers={"location": "https://%s%s" % (HOST, path), **(headers or {})})
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        route = self.stats.route("%s %s" % (request.method, path))
+        route.requests += 1
+        body = await request.aread()
+        route.bytes_in += len(body) + sum(len(key) + len(value) for key, value in request.headers.raw)
+
+        if self.latency:
+            await asyncio.sleep(self.latency * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+        if self.error_rate and self.random.random() < self.error_rate:
+            route.errors += 1
+            return self.respond(route, 503, b"<html><body>Service Unavailable</body></html>")
+
+        form = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        session = self.session_of(request)
+
+        if path == "/en/login":
+            return self.respond(route, 200, self.login_page())
+
+        if path == "/en/api/login" and request.method == "POST":
+            if form.get("_token") != self.csrf_token or not form.get("g-recaptcha-response"):
+                return self.respond(route, 422, json_body={"message": "The given data was invalid."})
+            if self.otp_secret:
+                return self.respond(route, 200, json_body={"is2FA": True})
+            return self.redirect(route, "/en/dashboard", {
+                "set-cookie": "%s=%s; path=/; httponly" % (SESSION_COOKIE, self.new_session())})
+
+        if path == "/en/api/otp-verify" and request.method == "POST":
+            code = (form.get("one_time_password") or "").replace(" ", "")
+            if not pyotp.TOTP(self.otp_secret).verify(code, valid_window=1):
+                return self.respond(route, 422, json_body={"message": "Invalid code."})
+            return self.redirect(route, "/en/dashboard", {
+                "set-cookie": "%s=%s; path=/; httponly" % (SESSION_COOKIE, self.new_session())})
+
+        if session is None:
+            # XHR endpoints answer 401, pages bounce to the login form
+            if request.headers.get("x-requested-with") == "XMLHttpRequest":
+                return self.respond(route, 401, json_body={"message": "Unauthenticated."})
+            return self.redirect(route, "/en/login")
+
+        if path == "/en/dashboard":
+            return self.respond(route, 200, self.dashboard_page)
+        if path in ("/en/statistics/brief", "/en/statistics/brief/currentWeek"):
+            return self.respond(route, 200, json_body=self.statistics())
+        if path == "/en/ratings/top":
+            return self.respond(route, 200, self.ratings_page())
+        if path == "/en/payments/history":
+            return self.respond(route, 200, self.history_page())
+        if path == "/en/payments/request":
+            if request.method == "POST":
+                amount = float(form.get("amount") or 0)
+                if form.get("_token") != self.csrf_token or not 0 < amount <= self.figures["balance"]:
+                    return self.respond(route, 200, self.request_page)
+                self.figures["balance"] = round(self.figures["balance"] - amount, 2)
+                self.payments.insert(0, {
+                    "id": self.payments and self.payments[0]["id"] + 1 or 1,
+                    "amount": amount,
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+                return self.redirect(route, "/en/payments/history")
+            return self.respond(route, 200, self.request_page)
+
+        return self.respond(route, 404, b"<html><body>Not Found</body></html>")
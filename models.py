@@ -1,19 +1,42 @@
 from tortoise.models import Model
-from tortoise import fields
+from tortoise import fields, connections
 
 from datetime import datetime, timedelta
+import time
 import pytz
 
+import accounts
+import core
+
 db_name = "pocketoption-local.db"
 logger = None
 
+# Tables namespaced by the `account` column
+ACCOUNT_TABLES = ["statistics", "statisticslog", "history", "withdrawal"]
+
 
 def current_hour() -> int:
     return datetime.now(tz=pytz.utc).time().hour
 
 
+def hour_bucket_of(moment: datetime) -> int:
+    """Whole UTC hours since the epoch, naive datetimes are taken as UTC."""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=pytz.utc)
+    return int(moment.timestamp()) // 3600
+
+
+def current_hour_bucket() -> int:
+    return hour_bucket_of(datetime.now(tz=pytz.utc))
+
+
+def current_account() -> str:
+    return accounts.current().name
+
+
 class Statistics(Model):
-    period = fields.CharField(max_length=50, unique=True, null=False)
+    account = fields.CharField(max_length=50, default=current_account)
+    period = fields.CharField(max_length=50, null=False)
     deposits = fields.FloatField(null=False)
     old_deposits = fields.FloatField(null=False)
     commission = fields.FloatField(null=False)
@@ -27,11 +50,15 @@ class Statistics(Model):
     account_status = fields.CharField(max_length=50, null=True)
     updated = fields.DatetimeField(auto_now_add=True)
 
+    class Meta:
+        unique_together = (("account", "period"),)
+
     def __str__(self):
         return "Statistics: %s" % self.period
 
 
 class StatisticsLog(Model):
+    account = fields.CharField(max_length=50, default=current_account)
     period = fields.CharField(max_length=50, null=False)
     deposits = fields.FloatField(null=False)
     commission = fields.FloatField(null=False)
@@ -45,6 +72,8 @@ class StatisticsLog(Model):
     ftd_avg = fields.FloatField(null=False)
     account_status = fields.CharField(max_length=50, null=True)
     run_hour = fields.IntField(null=False, default=current_hour)
+    # Hour of `updated` as an integer, looked up through (account, hour_bucket)
+    hour_bucket = fields.IntField(null=True, default=current_hour_bucket)
     updated = fields.DatetimeField(auto_now_add=True)
 
     def __str__(self):
@@ -52,6 +81,7 @@ class StatisticsLog(Model):
 
 
 class History(Model):
+    account = fields.CharField(max_length=50, default=current_account)
     request_id = fields.CharField(max_length=50, null=True)
     updated = fields.DatetimeField(auto_now_add=True)
 
@@ -61,6 +91,7 @@ class History(Model):
 
 class Withdrawal(Model):
     id = fields.IntField(pk=True)
+    account = fields.CharField(max_length=50, default=current_account)
 
     auto = fields.BooleanField(default=False)
     auto_all = fields.BooleanField(default=True)
@@ -75,9 +106,34 @@ class Withdrawal(Model):
         )
 
 
+class WithdrawalSettings:
+    """
+    The account's Withdrawal row, read once and served from memory. The
+    write functions below save through the same object, so it never goes
+    stale in this process; `ttl` covers writes made by another one.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.row: Withdrawal = None
+        self.loaded_at = 0.0
+
+    async def get(self) -> Withdrawal:
+        if self.row is None or time.monotonic() - self.loaded_at >= self.ttl:
+            self.row = await Withdrawal.filter(account=current_account()).first()
+            self.loaded_at = time.monotonic()
+        return self.row
+
+    def invalidate(self) -> None:
+        self.row = None
+
+
+withdrawal_settings = accounts.Scoped("withdrawal_settings", lambda account: WithdrawalSettings(core.settings_ttl))
+
+
 async def is_auto_withdrawal_active() -> bool:
     try:
-        obj = await Withdrawal.first()
+        obj = await withdrawal_settings.instance().get()
     except Exception as e:
         logger.exception("ERR_IS_AUTO_WITHDRAWAL_ACIVE: %s" % e)
     else:
@@ -86,39 +142,100 @@ async def is_auto_withdrawal_active() -> bool:
 
 async def toggle_auto_withdrawal(toggle: str) -> None:
     try:
-        obj = await Withdrawal.first()
+        obj = await withdrawal_settings.instance().get()
         obj.auto = toggle.lower().strip() == "on"
         await obj.save(update_fields=["auto"])
     except Exception as e:
+        # Re-read next time, the cached row may hold the unsaved value
+        withdrawal_settings.invalidate()
         logger.exception("ERR_TOGGLE_AUTO_WITHDRAWAL: %s" % e)
 
 async def update_withdrawal_settings(amount: int, period: int) -> None:
     try:
-        obj = await Withdrawal.first()
+        obj = await withdrawal_settings.instance().get()
         obj.amount = amount
         obj.period = period
         await obj.save(update_fields=["amount", "period"])
     except Exception as e:
+        withdrawal_settings.invalidate()
         logger.exception("ERR_UPDATE_WITHDRAWAL_SETTINGS: %s" % e)
 
 async def get_withdrawal_settings() -> tuple[int, int]:
     # print("Getting withdrawal settings")
     try:
-        obj = await Withdrawal.first()
+        obj = await withdrawal_settings.instance().get()
     except Exception as e:
         logger.exception("ERR_GET_WITHDRAWAL_SETTINGS: %s" % e)
     else:
         return obj.amount, obj.period
 
-def query_str(date: datetime.date, hour: int) -> str:
-    return "%s %s" % (
-        date, f"{hour:0>2}"
+async def table_columns(conn, table: str) -> list[str]:
+    _, rows = await conn.execute_query("PRAGMA table_info(%s)" % table)
+    return [row["name"] for row in rows]
+
+
+async def migrate_before_schemas() -> None:
+    """Moves aside tables whose constraints changed, ran before `generate_schemas`."""
+    conn = connections.get("default")
+    _, rows = await conn.execute_query("PRAGMA index_list(statistics)")
+    for row in rows:
+        if not row["unique"]:
+            continue
+        _, index_columns = await conn.execute_query("PRAGMA index_info(%s)" % row["name"])
+        # `period` used to be unique on its own, it is unique per account now
+        if [column["name"] for column in index_columns] == ["period"]:
+            logger.debug("Migrating table: statistics (unique period -> account, period)")
+            await conn.execute_script("ALTER TABLE statistics RENAME TO statistics_old")
+            break
+
+
+async def migrate_after_schemas() -> None:
+    """Adds the `account` column to tables created before multi-account support."""
+    conn = connections.get("default")
+    for table in ACCOUNT_TABLES:
+        if "account" not in await table_columns(conn, table):
+            logger.debug("Migrating table: %s (account column)" % table)
+            await conn.execute_script(
+                "ALTER TABLE %s ADD COLUMN account VARCHAR(50) NOT NULL DEFAULT '%s'" % (
+                    table, accounts.default.name
+                ))
+
+    _, rows = await conn.execute_query(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'statistics_old'")
+    if rows:
+        columns = [
+            column for column in await table_columns(conn, "statistics_old")
+            if column in await table_columns(conn, "statistics") and column != "account"
+        ]
+        await conn.execute_script(
+            "INSERT INTO statistics (%s, account) SELECT %s, '%s' FROM statistics_old; DROP TABLE statistics_old;" % (
+                ", ".join(columns), ", ".join(columns), accounts.default.name
+            ))
+
+    if "hour_bucket" not in await table_columns(conn, "statisticslog"):
+        logger.debug("Migrating table: statisticslog (hour_bucket column)")
+        await conn.execute_script("ALTER TABLE statisticslog ADD COLUMN hour_bucket INT")
+    # `updated` is stored as UTC ISO text, which strftime('%s') understands
+    await conn.execute_script(
+        "UPDATE statisticslog SET hour_bucket = CAST(strftime('%s', updated) AS INTEGER) / 3600 "
+        "WHERE hour_bucket IS NULL"
     )
 
+    await conn.execute_script(
+        "CREATE INDEX IF NOT EXISTS idx_statisticslog_account ON statisticslog (account, id);"
+        "CREATE INDEX IF NOT EXISTS idx_statisticslog_bucket ON statisticslog (account, hour_bucket);"
+        "CREATE INDEX IF NOT EXISTS idx_history_account ON history (account);"
+        "CREATE INDEX IF NOT EXISTS idx_withdrawal_account ON withdrawal (account);"
+    )
+
+
+def bucket_of(date: datetime.date, hour: int) -> int:
+    return hour_bucket_of(datetime(date.year, date.month, date.day)) + hour
+
 
 async def get_last_log() -> StatisticsLog:
     try:
-        obj = await StatisticsLog.filter().order_by("-id").first()
+        obj = await StatisticsLog.filter(account=current_account()).order_by("-id").first()
     except Exception as e:
         logger.exception("ERR_GET_LAST_LOG: %s" % e)
     else:
@@ -139,20 +256,17 @@ async def get_log_data(date: datetime.date = None, hour: int = None, failsafe: b
         hour = current_hour()
 
     logger.debug("Date: %s | Hour: %s" % (date, hour))
-    required_date = date
-    one_less_required_hour = hour - 1
-
-    if one_less_required_hour < 0:
-        one_less_required_hour = 23
-        required_date = date - timedelta(days=1)
+    # The hour before is the fallback, across midnight too
+    bucket = bucket_of(date, hour)
 
     try:
         return await StatisticsLog.filter(
-            updated__startswith=query_str(date, hour),
-        ).first() or await StatisticsLog.filter(
-            updated__startswith=query_str(
-                required_date, one_less_required_hour),
-        ).first()
+            account=current_account(),
+            hour_bucket=bucket,
+        ).order_by("id").first() or await StatisticsLog.filter(
+            account=current_account(),
+            hour_bucket=bucket - 1,
+        ).order_by("id").first()
     except Exception as e:
         logger.exception("ERR_GET_LOG_DATA: %s | %s" % (
             date, hour
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import httpx
+
+import accounts
+import core
+import extract
+
+logger = None
+
+
+class CachedPage:
+    """A fetched page whose document is parsed once, on first access."""
+
+    def __init__(self, response: httpx.Response, parse) -> None:
+        self.response = response
+        self._parse = parse
+        self._document = None
+
+    @property
+    def document(self):
+        if self._document is None:
+            self._document = self._parse(self.response.content)
+        return self._document
+
+    async def parsed(self):
+        # Same document, big pages are parsed off the event loop
+        if self._document is None:
+            self._document = await extract.offload(self._parse, self.response.content)
+        return self._document
+
+
+class PageCache:
+    """
+    Single-flight, short-TTL page cache keyed by URL.
+    Concurrent callers share one in-flight request, later callers reuse
+    the result until it expires or gets invalidated.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.entries: dict[str, tuple[asyncio.Future, float]] = {}
+
+    async def get(self, url: str, loader) -> CachedPage:
+        if entry := self.entries.get(url):
+            future, expires_at = entry
+            if not future.done() or time.monotonic() < expires_at:
+                return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.entries[url] = (future, float("inf"))
+        try:
+            page = await loader(url)
+        except asyncio.CancelledError:
+            self._drop(url, future)
+            future.cancel()
+            raise
+        except Exception as e:
+            # Failures are never cached, the next caller tries again
+            self._drop(url, future)
+            future.set_exception(e)
+            future.exception()
+            raise
+
+        future.set_result(page)
+        if self.entries.get(url, (None,))[0] is future:
+            self.entries[url] = (future, time.monotonic() + self.ttl)
+        return page
+
+    def peek(self, url: str) -> CachedPage | None:
+        # A ready and still fresh page, without ever loading one
+        if entry := self.entries.get(url):
+            future, expires_at = entry
+            if future.done() and not future.cancelled() and future.exception() is None \
+                    and time.monotonic() < expires_at:
+                return future.result()
+        return None
+
+    def put(self, url: str, page: CachedPage) -> None:
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(page)
+        self.entries[url] = (future, time.monotonic() + self.ttl)
+
+    def invalidate(self, url: str = None) -> None:
+        if url is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(url, None)
+        if logger:
+            logger.debug("Page cache invalidated: %s" % (url or "all"))
+
+    def _drop(self, url: str, future: asyncio.Future) -> None:
+        if self.entries.get(url, (None,))[0] is future:
+            del self.entries[url]
+
+
+pages = accounts.Scoped("page_cache", lambda account: PageCache(ttl=core.page_cache_ttl))
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+import core
+
+logger = None
+
+
+@dataclass(slots=True)
+class StageStats:
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    # Seconds spent inside the stage function
+    busy: float = 0.0
+    # Seconds spent waiting for room in the next stage's queue (backpressure)
+    blocked: float = 0.0
+
+
+class Stage:
+    """
+    One step of a Pipeline: `workers` tasks take items from a bounded queue
+    and hand `func(item)` on to the next stage. None drops the item, a list
+    is handed on item by item.
+    """
+
+    def __init__(self, name: str, func, workers: int = 1, maxsize: int = None) -> None:
+        self.name = name
+        self.func = func
+        self.workers = max(workers, 1)
+        self.queue = asyncio.Queue(maxsize or core.pipeline_queue_size)
+        self.stats = StageStats()
+
+    def __repr__(self) -> str:
+        return "Stage(%s, workers=%s)" % (self.name, self.workers)
+
+
+class Pipeline:
+    """
+    Stages connected by bounded asyncio queues, every stage with its own
+    workers. A full queue blocks the stage before it, so a slow stage slows
+    down its producers instead of piling up items. `sink` receives what
+    the last stage returns.
+    """
+
+    def __init__(self, name: str, stages: list[Stage], sink=None) -> None:
+        self.name = name
+        self.stages = stages
+        self.sink = sink
+        self.tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        # Workers are started by the first put(), inside the caller's context
+        # (the account the pipeline belongs to)
+        if self.tasks:
+            return
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                self.tasks.append(asyncio.create_task(
+                    self.work(index), name="%s-%s-%s" % (self.name, stage.name, worker)))
+
+    async def put(self, item) -> None:
+        self.start()
+        await self.stages[0].queue.put(item)
+
+    async def join(self) -> None:
+        """Waits until everything put so far went through every stage."""
+        for stage in self.stages:
+            await stage.queue.join()
+
+    async def hand_on(self, index: int, item) -> None:
+        if index + 1 < len(self.stages):
+            await self.stages[index + 1].queue.put(item)
+        elif self.sink is not None:
+            await self.sink(item)
+
+    async def work(self, index: int) -> None:
+        stage = self.stages[index]
+        while True:
+            item = await stage.queue.get()
+            try:
+                started = time.perf_counter()
+                try:
+                    result = await stage.func(item)
+                except Exception as e:
+                    stage.stats.failed += 1
+                    logger.exception("ERR_PIPELINE_%s: %s | %s" % (stage.name.upper(), self.name, e))
+                    continue
+                finished = time.perf_counter()
+                stage.stats.busy += finished - started
+
+                if result is None:
+                    stage.stats.dropped += 1
+                    continue
+                stage.stats.processed += 1
+                for result_item in isinstance(result, list) and result or [result]:
+                    await self.hand_on(index, result_item)
+                stage.stats.blocked += time.perf_counter() - finished
+            finally:
+                stage.queue.task_done()
+
+    async def stop(self, drain_timeout: float = 0.0) -> None:
+        if drain_timeout and self.tasks:
+            try:
+                await asyncio.wait_for(self.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Pipeline %s: stopped with %s item(s) pending" % (
+                    self.name, sum(stage.queue.qsize() for stage in self.stages)))
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def summary(self) -> str:
+        return " | ".join(
+            "%s: %s ok, %s dropped, %s failed, %.2fs busy, %.2fs blocked, %s queued" % (
+                stage.name, stage.stats.processed, stage.stats.dropped, stage.stats.failed,
+                stage.stats.busy, stage.stats.blocked, stage.queue.qsize()
+            )
+            for stage in self.stages
+        )
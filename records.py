@@ -0,0 +1,177 @@
+import hashlib
+from dataclasses import dataclass, field, replace
+
+# Money figures of the brief statistics, tracked against the previous scrape
+MONEY_FIELDS = ("deposits", "commission", "withdrawals", "balance", "bonus")
+# Traffic figures, only ever compared with last week
+ACTIVITY_FIELDS = ("visitors", "registrations", "registrations_avg", "ftd", "ftd_avg")
+STATS_FIELDS = MONEY_FIELDS + ACTIVITY_FIELDS
+
+
+@dataclass(slots=True)
+class StatsSnapshot:
+    """The figures of one statistics scrape (or of a StatisticsLog row)."""
+
+    deposits: float = 0.0
+    commission: float = 0.0
+    withdrawals: float = 0.0
+    balance: float = 0.0
+    bonus: float = 0.0
+    visitors: int = 0
+    registrations: int = 0
+    registrations_avg: float = 0
+    ftd: int = 0
+    ftd_avg: float = 0.0
+
+    @classmethod
+    def from_json(cls, res_json: dict) -> "StatsSnapshot":
+        visitors = int(res_json["clicks"])
+        registrations = int(res_json["regs"])
+        ftd = int(res_json["count_ftd"])
+        return cls(
+            deposits=float(res_json["sum_depo"] or 0.0),
+            commission=float(res_json["sum_commission"] or 0.0),
+            withdrawals=float(res_json["sum_wdrl"] or 0.0),
+            balance=float(res_json["balance"] or 0.0),
+            bonus=float(res_json.get("bonus") or 0.0),
+            visitors=visitors,
+            registrations=registrations,
+            registrations_avg=visitors and int((registrations / visitors) * 100) or 0,
+            ftd=ftd,
+            ftd_avg=registrations and round((ftd / registrations) * 100, 2) or 0,
+        )
+
+    @classmethod
+    def from_row(cls, row) -> "StatsSnapshot":
+        # Any object carrying the same attributes, e.g. models.StatisticsLog
+        return cls(*(getattr(row, name) for name in STATS_FIELDS))
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, name) for name in STATS_FIELDS)
+
+    def as_dict(self) -> dict:
+        return dict(zip(STATS_FIELDS, self.values()))
+
+    def fingerprint(self) -> str:
+        # Equal figures, equal fingerprint, whatever else the JSON carried
+        figures = tuple(float(value) for value in self.values())
+        return hashlib.blake2b(repr(figures).encode(), digest_size=8).hexdigest()
+
+    def __sub__(self, other: "StatsSnapshot") -> "StatsSnapshot":
+        return StatsSnapshot(*(
+            round(value - other_value, 2)
+            for value, other_value in zip(self.values(), other.values())
+        ))
+
+
+@dataclass(slots=True)
+class StatsDelta:
+    """
+    One processed period: the current figures, the ones of the previous
+    scrape, the change between both and the change against last week.
+    """
+
+    period: str
+    current: StatsSnapshot
+    old: StatsSnapshot
+    account_status: str = "unknown"
+    account_email: str = "unknown"
+    account_id: str = "unknown"
+    change: StatsSnapshot = None
+    week_change: StatsSnapshot = field(default_factory=StatsSnapshot)
+    rank: str = None
+    deposits_sum: str = None
+
+    def __post_init__(self) -> None:
+        if self.change is None:
+            self.change = self.current - self.old
+
+    @classmethod
+    def from_previous(cls, period: str, current: StatsSnapshot, previous: StatsSnapshot, **kwargs) -> "StatsDelta":
+        # Only the money figures have a previous value, traffic is compared weekly
+        return cls(period, current, replace(current, **{
+            name: getattr(previous, name) for name in MONEY_FIELDS
+        }), **kwargs)
+
+    def repeated(self, **kwargs) -> "StatsDelta":
+        """The same figures scraped again: no change since, the week change still holds."""
+        return replace(self, old=self.current, change=None, rank=None, deposits_sum=None, **kwargs)
+
+    def money(self, name: str) -> tuple:
+        """`(old, change, current, week_change)` of one money figure, as alert.py renders it."""
+        return (
+            getattr(self.old, name), getattr(self.change, name),
+            getattr(self.current, name), getattr(self.week_change, name)
+        )
+
+    def activity(self) -> tuple:
+        return tuple(getattr(self.current, name) for name in ACTIVITY_FIELDS) + \
+            tuple(getattr(self.week_change, name) for name in ACTIVITY_FIELDS)
+
+
+@dataclass(slots=True)
+class PaymentRow:
+    """One row of the payments history table."""
+
+    id: str
+    amount_text: str = ""
+    amount: float = None
+    method: str = ""
+    status: str = ""
+    created: str = ""
+    updated: str = ""
+
+    @classmethod
+    def from_cells(cls, cells: dict[str, str]) -> "PaymentRow":
+        # Cells are keyed by their `data-label`
+        amount_text = cells.get("Amount, $", "").replace("$", "").strip()
+        try:
+            amount = float(amount_text.replace("'", "").replace(",", ""))
+        except ValueError:
+            amount = None
+        return cls(
+            id=cells.get("ID", ""),
+            amount_text=amount_text,
+            amount=amount,
+            method=cells.get("Payment method", ""),
+            status=cells.get("Status", ""),
+            created=cells.get("Date of creation", ""),
+            updated=cells.get("Date of update", ""),
+        )
+
+
+@dataclass(slots=True)
+class StatsScrape:
+    """One period on its way through the statistics pipeline, filled in stage by stage."""
+
+    period: str
+    account_status: str = "unknown"
+    account_email: str = "unknown"
+    account_id: str = "unknown"
+    update_db: bool = True
+    # fetch: the brief statistics JSON
+    res_json: dict = None
+    # fingerprint: set `unchanged` when the figures did not move since the
+    # last scrape, diff and persist then pass it through
+    fingerprint: str = None
+    unchanged: bool = False
+    # diff: the figures against the stored scrape, `stored` once it had a row
+    stats: StatsDelta = None
+    stored: bool = False
+
+    def account(self) -> dict:
+        return {
+            "account_status": self.account_status,
+            "account_email": self.account_email,
+            "account_id": self.account_id,
+        }
+
+
+@dataclass(slots=True)
+class OutgoingMessage:
+    """A Telegram message waiting for the delivery stage."""
+
+    user_id: int | str
+    text: str
+    disable_notification: bool = False
+    options: dict = field(default_factory=dict)
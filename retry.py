@@ -0,0 +1,195 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+logger = None
+
+# Error kinds
+TRANSPORT = "transport"
+AUTH = "auth"
+SERVER = "server"
+PAYLOAD = "payload"
+OTHER = "other"
+
+TRANSPORT_ERRORS = (
+    httpx.ConnectError, httpx.ProxyError, httpx.ReadTimeout,
+    httpx.ConnectTimeout, httpx.WriteTimeout, httpx.PoolTimeout,
+    httpx.RemoteProtocolError, httpx.ReadError,
+)
+
+
+class RetryableError(Exception):
+    kind = OTHER
+
+    def __init__(self, message: str, response: httpx.Response = None) -> None:
+        super().__init__(message)
+        self.response = response
+
+
+class AuthError(RetryableError):
+    kind = AUTH
+
+
+class ServerError(RetryableError):
+    kind = SERVER
+
+
+class PayloadError(RetryableError):
+    kind = PAYLOAD
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float) -> None:
+        super().__init__("Circuit open for %s, retry in %ss" % (host, round(retry_in)))
+        self.host = host
+        self.retry_in = retry_in
+
+
+def classify(error: BaseException) -> str:
+    if isinstance(error, RetryableError):
+        return error.kind
+    if isinstance(error, TRANSPORT_ERRORS):
+        return TRANSPORT
+    return OTHER
+
+
+def check_response(res: httpx.Response) -> httpx.Response:
+    if res.status_code in (401, 419):
+        raise AuthError("HTTP %s" % res.status_code, res)
+    if res.status_code >= 500:
+        raise ServerError("HTTP %s" % res.status_code, res)
+    return res
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    # "Full jitter": a random delay between 0 and the exponential ceiling
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures, lets one probe through after `reset_after`."""
+
+    def __init__(self, host: str, threshold: int = 5, reset_after: float = 60.0) -> None:
+        self.host = host
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: float = None
+        # When the half-open probe went out, None while no probe is in flight
+        self.probe_started: float = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return "half-open"
+        return "open"
+
+    def check(self, probe: bool = True) -> None:
+        """
+        Raises CircuitOpenError unless a request may go out. Half-open, only
+        the first caller is let through (`probe`), the others wait for its
+        outcome. A probe that never reports expires after `reset_after`.
+        """
+        now = time.monotonic()
+        state = self.state
+        if state == "open":
+            raise CircuitOpenError(self.host, self.reset_after - (now - self.opened_at))
+        if state == "half-open":
+            if self.probe_started is not None and now - self.probe_started < self.reset_after:
+                raise CircuitOpenError(self.host, self.reset_after - (now - self.probe_started))
+            if probe:
+                self.probe_started = now
+
+    def release(self) -> None:
+        # The probe ended without saying anything about the host's health
+        self.probe_started = None
+
+    def record_success(self) -> None:
+        if self.opened_at is not None and logger:
+            logger.info("Circuit closed for %s" % self.host)
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_started = None
+        if self.state == "half-open" or self.failures >= self.threshold:
+            # A failed probe restarts the cool down
+            self.opened_at = time.monotonic()
+            if logger:
+                logger.warning("Circuit opened for %s after %s failures" % (
+                    self.host, self.failures))
+
+
+breakers: dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(url: str | httpx.URL) -> CircuitBreaker:
+    host = httpx.URL(url).host
+    if host not in breakers:
+        breakers[host] = CircuitBreaker(host)
+    return breakers[host]
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        retry_on: tuple[str, ...] = (TRANSPORT, SERVER),
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    async def run(self, func, breaker: CircuitBreaker = None, on_retry=None, label: str = ""):
+        """
+        Awaits `func()` until it succeeds or the error is not retryable.
+        :param func: coroutine factory, called once per attempt
+        :param breaker: circuit breaker of the target host (optional)
+        :param on_retry: `async (kind, error)` hook ran before the next attempt
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if breaker is not None:
+                breaker.check()
+            try:
+                result = await func()
+            except Exception as e:
+                kind = classify(e)
+                if breaker is not None:
+                    if kind in (TRANSPORT, SERVER):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                if kind not in self.retry_on or attempt >= self.max_attempts:
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                if logger:
+                    logger.warning("%s failed with %s error (attempt %s/%s), retrying in %ss: %s" % (
+                        label or "Request", kind, attempt, self.max_attempts,
+                        round(delay, 2), e
+                    ))
+                if on_retry is not None:
+                    await on_retry(kind, e)
+                await asyncio.sleep(delay)
+            else:
+                if breaker is not None:
+                    breaker.record_success()
+                return result
+
+
+# Raw GETs, covers connection and 5xx trouble only
+fetch_policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=10.0)
+
+# Page/JSON level retries, transport errors are already retried by `fetch_policy`
+# (a 5xx or 429 that outlived those gets one more go, the breaker permitting)
+payload_policy = RetryPolicy(max_attempts=2, base_delay=2.0, max_delay=10.0, retry_on=(AUTH, SERVER, PAYLOAD))
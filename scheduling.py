@@ -0,0 +1,303 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+import accounts
+import core
+
+logger = None
+
+
+def jitter(name: str, job: str, window: float) -> float:
+    """
+    Deterministic offset in `[0, window)` seconds for one account's job.
+    The same account always gets the same slot, different accounts spread
+    evenly over the window.
+    """
+    if window <= 0:
+        return 0.0
+    digest = hashlib.sha1(("%s:%s" % (name, job)).encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 * window
+
+
+def scrape_slot(name: str = None) -> float:
+    """
+    Second of the hour the account's statistics scrape starts at. Slots are
+    spread over `scrape_window` seconds that end `scrape_lead` seconds
+    before the :00 alert, so every scrape has time to finish.
+    """
+    name = name or accounts.current().name
+    lead = min(max(core.scrape_lead, 0), 3540)
+    window = min(max(core.scrape_window, 0), 3600 - 60 - lead)
+    return 3600 - lead - window + jitter(name, "scrape", window)
+
+
+def scrape_schedule(name: str = None) -> "Cron":
+    # At the account's slot before every :00, still worth running up to :00
+    slot = scrape_slot(name)
+    return Cron("0 * * * *", offset=slot - 3600, grace=3600 - slot)
+
+
+def alert_schedule() -> "Cron":
+    return Cron("0 * * * *", grace=core.alert_grace)
+
+
+def withdrawal_slot(interval: int, name: str = None) -> float:
+    # Never shifted by a full interval, the slot stays inside its own period
+    name = name or accounts.current().name
+    window = min(max(core.withdrawal_window, 0), max(interval * 60 - 60, 0))
+    return jitter(name, "withdrawal", window)
+
+
+def withdrawal_schedule(interval: int, name: str = None) -> "Interval":
+    """
+    Every `interval` minutes counted from the epoch, i.e. `minute % interval
+    == 0` for intervals dividing the hour, and once a day for 1440. Shifted
+    by the account's offset so accounts do not all hit the site in one second.
+    """
+    interval = max(int(interval), 1)
+    return Interval(interval * 60, offset=withdrawal_slot(interval, name))
+
+
+class Interval:
+    """Fixed period of `seconds`, anchored at the epoch shifted by `offset`."""
+
+    def __init__(self, seconds: float, offset: float = 0.0, grace: float = None) -> None:
+        if seconds <= 0:
+            raise ValueError("Interval must be positive: %s" % seconds)
+        self.seconds = seconds
+        self.offset = offset % seconds
+        # A missed slot is still run this late, one period by default
+        self.grace = seconds if grace is None else grace
+
+    def __repr__(self) -> str:
+        return "Interval(%ss, offset=%ss)" % (self.seconds, round(self.offset, 1))
+
+    def next_after(self, timestamp: float) -> float:
+        return self.offset + (math.floor((timestamp - self.offset) / self.seconds) + 1) * self.seconds
+
+
+class AdaptiveInterval(Interval):
+    """
+    Interval counted from the last run that follows what the runs see:
+    halved after every run that saw activity, down to `floor`, doubled
+    after every quiet one, up to `ceiling`. It starts at the floor.
+    """
+
+    def __init__(self, floor: float, ceiling: float, factor: float = 2.0) -> None:
+        super().__init__(floor)
+        self.floor = floor
+        self.ceiling = max(ceiling, floor)
+        self.factor = factor
+
+    def __repr__(self) -> str:
+        return "AdaptiveInterval(%ss, %s-%ss)" % (round(self.seconds), self.floor, self.ceiling)
+
+    def next_after(self, timestamp: float) -> float:
+        return timestamp + self.seconds
+
+    def observe(self, active: bool) -> None:
+        if active:
+            self.seconds = max(self.seconds / self.factor, self.floor)
+        else:
+            self.seconds = min(self.seconds * self.factor, self.ceiling)
+        self.grace = self.seconds
+
+
+class RequestBudget:
+    """At most `limit` requests in any `window` seconds."""
+
+    def __init__(self, limit: int, window: float = 3600.0) -> None:
+        self.limit = limit
+        self.window = window
+        self.spent: deque[float] = deque()
+
+    def remaining(self) -> int:
+        now = time.monotonic()
+        while self.spent and now - self.spent[0] >= self.window:
+            self.spent.popleft()
+        return max(self.limit - len(self.spent), 0)
+
+    def spend(self) -> bool:
+        if not self.remaining():
+            return False
+        self.spent.append(time.monotonic())
+        return True
+
+
+class Cron:
+    """
+    Five field cron expression (`minute hour day month weekday`, UTC) with
+    `*`, lists, ranges and steps, e.g. "*/15 8-20 * * 1-5". Fire times are
+    moved by `offset` seconds, negative to run ahead of the matching minute.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression: str, offset: float = 0.0, grace: float = 60.0) -> None:
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: %r" % expression)
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self.parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)
+        )
+        # Cron semantics: with both restricted, either day field matching is enough
+        self.any_day = fields[2] != "*" and fields[4] != "*"
+        self.offset = offset
+        self.grace = grace
+
+    def __repr__(self) -> str:
+        return "Cron(%r, offset=%ss)" % (self.expression, round(self.offset, 1))
+
+    @staticmethod
+    def parse_field(field: str, low: int, high: int) -> set[int]:
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = end = int(part)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError("Cron field out of range: %r" % field)
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        # Cron counts weekdays from Sunday
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return day or weekday if self.any_day else day and weekday
+
+    def next_after(self, timestamp: float) -> float:
+        moment = datetime.fromtimestamp(timestamp - self.offset, tz=timezone.utc)
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Whole months, days and hours are skipped at once
+        limit = moment + timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp() + self.offset
+        raise ValueError("Cron expression never fires: %r" % self.expression)
+
+
+class Job:
+    """
+    A coroutine function run on a schedule. `schedule` is an Interval or a
+    Cron, or a coroutine function returning one when it depends on settings
+    that can change while the job is scheduled.
+    """
+
+    def __init__(self, name: str, func, schedule) -> None:
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.task: asyncio.Task = None
+
+    async def resolve(self) -> Interval | Cron:
+        if isinstance(self.schedule, (Interval, Cron)):
+            return self.schedule
+        return await self.schedule()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+
+class Scheduler:
+    """
+    Sleeps until the next job is due instead of polling the clock. The
+    last slot of every job is kept in `store`, so a slot missed while a
+    job overran, or while the bot was down, runs once as long as it is
+    within the schedule's grace; older ones are dropped. A job still
+    running when its next slot comes skips that slot.
+    """
+
+    def __init__(self, jobs: list[Job], store=None, on_error=None, nap: float = None) -> None:
+        self.jobs = {job.name: job for job in jobs}
+        self.store = store
+        self.last_runs: dict[str, float] = {}
+        self.on_error = on_error
+        # The stop events are plain threading/multiprocessing events, sleeps
+        # are cut at `nap` seconds so clearing them is noticed
+        self.nap = core.scheduler_nap if nap is None else nap
+
+    def last_run(self, job: Job) -> float | None:
+        if job.name not in self.last_runs and self.store is not None:
+            self.last_runs[job.name] = self.store.get("schedule:%s" % job.name)
+        return self.last_runs.get(job.name)
+
+    def mark_run(self, job: Job, slot: float) -> None:
+        self.last_runs[job.name] = slot
+        if self.store is not None:
+            self.store.set("schedule:%s" % job.name, slot)
+
+    async def next_slot(self, job: Job, now: float) -> float:
+        schedule = await job.resolve()
+        if (last := self.last_run(job)) is None:
+            # Never run before, nothing to catch up on
+            last = self.last_runs[job.name] = now
+        slot = schedule.next_after(max(last, now - schedule.grace))
+        # Several missed slots are run once, as the latest of them
+        while slot <= now and (following := schedule.next_after(slot)) <= now:
+            slot = following
+        return slot
+
+    async def execute(self, job: Job, slot: float) -> None:
+        lateness = time.time() - slot
+        if lateness > 1:
+            logger.debug("Job %s: running the %s slot %.0fs late" % (
+                job.name, time.strftime("%H:%M:%S", time.gmtime(slot)), lateness))
+        try:
+            await job.func()
+        except Exception as e:
+            logger.exception("ERR_JOB_%s: %s" % (job.name.upper(), e))
+            if self.on_error:
+                await self.on_error(job, e)
+
+    async def idle(self, name: str) -> None:
+        # Lets one job wait for another, e.g. the alert for the scrape it sends
+        job = self.jobs[name]
+        if job.running:
+            await asyncio.shield(job.task)
+
+    async def run(self, active=lambda: True) -> None:
+        for job in self.jobs.values():
+            logger.debug("Job %s [%s]: %s" % (job.name, accounts.current().name, await job.resolve()))
+        try:
+            while active():
+                now = time.time()
+                slots = {name: await self.next_slot(job, now) for name, job in self.jobs.items()}
+                for name, slot in slots.items():
+                    if slot > now:
+                        continue
+                    job = self.jobs[name]
+                    self.mark_run(job, slot)
+                    if job.running:
+                        logger.warning("Job %s: still running, skipping its %s slot" % (
+                            name, time.strftime("%H:%M:%S", time.gmtime(slot))))
+                        continue
+                    job.task = asyncio.create_task(self.execute(job, slot), name="job-%s" % name)
+
+                wake_at = min((slot for slot in slots.values() if slot > now), default=now)
+                await asyncio.sleep(max(min(wake_at - time.time(), self.nap), 0))
+        finally:
+            # Letting a withdrawal in progress finish rather than cutting it
+            await asyncio.gather(*(
+                job.task for job in self.jobs.values() if job.running
+            ), return_exceptions=True)
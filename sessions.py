@@ -0,0 +1,177 @@
+import importlib.util
+
+import httpx
+
+import accounts
+import core
+
+logger = None
+
+# Replaces the network for every pool when set, e.g. the mock site of mock_server.py
+upstream: httpx.AsyncBaseTransport = None
+
+
+def http2_available() -> bool:
+    # httpx only speaks HTTP/2 when the optional "h2" package is installed
+    return importlib.util.find_spec("h2") is not None
+
+
+def proxy_url_of(proxy: dict | str | None) -> str | None:
+    if isinstance(proxy, dict):
+        return proxy.get("https://") or proxy.get("http://")
+    return proxy
+
+
+class TrackedStream(httpx.AsyncByteStream):
+    """Response body that tells its pool when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close) -> None:
+        self.stream = stream
+        self.on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self.stream.aclose()
+        finally:
+            if on_close := self.on_close:
+                self.on_close = None
+                await on_close()
+
+
+class RotatingTransport(httpx.AsyncBaseTransport):
+    """Keeps one connection pool per proxy and routes requests to the active one."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool = False, retries: int = 3) -> None:
+        self.limits = limits
+        self.http2 = http2
+        self.retries = retries
+        self.proxy_url: str | None = None
+        self._pools: dict[str | None, httpx.AsyncHTTPTransport] = {}
+        # Requests (response bodies included) still running on a pool
+        self._in_flight: dict[httpx.AsyncBaseTransport, int] = {}
+        # Recycled pools, closed once their last request is done
+        self._retired: set[httpx.AsyncBaseTransport] = set()
+
+    def _pool(self, proxy_url: str | None) -> httpx.AsyncBaseTransport:
+        if upstream is not None:
+            return upstream
+        if proxy_url not in self._pools:
+            self._pools[proxy_url] = httpx.AsyncHTTPTransport(
+                proxy=proxy_url,
+                limits=self.limits,
+                http2=self.http2,
+                retries=self.retries,
+            )
+        return self._pools[proxy_url]
+
+    def use(self, proxy_url: str | None) -> None:
+        self._pool(proxy_url)
+        self.proxy_url = proxy_url
+
+    async def recycle(self, proxy_url: str | None = None) -> None:
+        # Drops the pooled connections of a single proxy only, a rotating
+        # upstream hands out a new exit IP on the next CONNECT. New requests
+        # get a fresh pool, the old one is closed once the requests still
+        # running on it are done.
+        if pool := self._pools.pop(proxy_url, None):
+            if self._in_flight.get(pool):
+                self._retired.add(pool)
+            else:
+                await pool.aclose()
+
+    async def _release(self, pool: httpx.AsyncBaseTransport) -> None:
+        if pool not in self._in_flight:
+            # The transport was closed in the meantime
+            return
+        self._in_flight[pool] -= 1
+        if not self._in_flight[pool]:
+            del self._in_flight[pool]
+            if pool in self._retired:
+                self._retired.discard(pool)
+                await pool.aclose()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        pool = self._pool(self.proxy_url)
+        self._in_flight[pool] = self._in_flight.get(pool, 0) + 1
+        try:
+            response = await pool.handle_async_request(request)
+        except BaseException:
+            await self._release(pool)
+            raise
+        response.stream = TrackedStream(response.stream, lambda: self._release(pool))
+        return response
+
+    async def aclose(self) -> None:
+        for pool in [*self._pools.values(), *self._retired]:
+            await pool.aclose()
+        self._pools.clear()
+        self._retired.clear()
+        self._in_flight.clear()
+
+
+class SessionManager:
+    """Owns the single long-lived `httpx.AsyncClient` of an account."""
+
+    def __init__(self) -> None:
+        self.client: httpx.AsyncClient = None
+        self.transport: RotatingTransport = None
+
+    def build(self, proxy: dict | str | None = None) -> httpx.AsyncClient:
+        http2 = core.http2_enabled and http2_available()
+        if core.http2_enabled and not http2 and logger:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+
+        self.transport = RotatingTransport(
+            limits=httpx.Limits(
+                max_connections=core.pool_max_connections,
+                max_keepalive_connections=core.pool_max_keepalive,
+                keepalive_expiry=core.pool_keepalive_expiry,
+            ),
+            http2=http2,
+        )
+        self.transport.use(proxy_url_of(proxy))
+        self.client = httpx.AsyncClient(
+            headers=core.base_headers,
+            transport=self.transport,
+            follow_redirects=True,
+            timeout=core.request_timeout,
+        )
+        return self.client
+
+    @property
+    def active_proxy(self) -> str | None:
+        return self.transport and self.transport.proxy_url
+
+    async def ensure(self, proxy: dict | str | None = None) -> httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            self.build(proxy)
+            if logger:
+                logger.info("Created pooled HTTP session (proxy: %s)" % bool(proxy))
+        return self.client
+
+    async def rotate(self, proxy: dict | str | None = None) -> httpx.AsyncClient:
+        """Switch the outgoing proxy while keeping the client and its cookie jar."""
+        if self.client is None or self.client.is_closed:
+            return await self.ensure(proxy)
+
+        proxy_url = proxy_url_of(proxy)
+        if proxy_url == self.transport.proxy_url:
+            await self.transport.recycle(proxy_url)
+        self.transport.use(proxy_url)
+        if logger:
+            logger.info("Rotated proxy on pooled HTTP session")
+        return self.client
+
+    async def aclose(self) -> None:
+        if self.client is not None and not self.client.is_closed:
+            await self.client.aclose()
+        self.client = None
+        self.transport = None
+
+
+# One pooled client (and cookie jar) per account
+manager = accounts.Scoped("session_manager", lambda account: SessionManager())
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import multiprocessing
+import queue
+import time
+
+logger = None
+
+RESTART_BASE = 5.0       # <- seconds
+RESTART_MAX = 5 * 60.0   # <- seconds
+
+
+def shard_of(name: str, shard_count: int) -> int:
+    """
+    Rendezvous hashing: an account keeps its shard as long as that shard
+    exists, changing the shard count only moves the accounts it has to.
+    """
+    return max(
+        range(shard_count),
+        key=lambda shard: hashlib.sha1(("%s:%s" % (shard, name)).encode()).digest()
+    )
+
+
+def assign(account_list: list, shard_count: int) -> dict[int, list]:
+    assignment = {shard: [] for shard in range(shard_count)}
+    for account in account_list:
+        assignment[shard_of(account.name, shard_count)].append(account)
+    return assignment
+
+
+class Outbox:
+    """Worker side of the result queue, everything sent is handled by the parent."""
+
+    def __init__(self, shard: int, channel: multiprocessing.Queue) -> None:
+        self.shard = shard
+        self.channel = channel
+
+    def put(self, kind: str, account: str, payload: dict) -> None:
+        self.channel.put((kind, self.shard, account, payload))
+
+
+class ShardSupervisor:
+    """
+    Runs `target(shard, shard_count, outbox, events)` in one process per shard,
+    restarts the ones that die (with backoff) and hands whatever the workers
+    put on their outbox over to the parent's `handle` coroutine.
+    """
+
+    def __init__(self, target, shard_count: int, events: dict) -> None:
+        self.target = target
+        self.shard_count = shard_count
+        self.context = multiprocessing.get_context("spawn")
+        self.channel = self.context.Queue()
+        self.events = {name: self.context.Event() for name in events}
+        self.processes: dict[int, multiprocessing.Process] = {}
+        self.restarts: dict[int, int] = {}
+        self.restart_at: dict[int, float] = {}
+
+        # The parent's events start out like the ones they replace
+        for name, event in events.items():
+            if event.is_set():
+                self.events[name].set()
+
+    def spawn(self, shard: int) -> None:
+        process = self.context.Process(
+            target=self.target,
+            args=(shard, self.shard_count, Outbox(shard, self.channel), self.events),
+            name="shard-%s" % shard,
+            daemon=True
+        )
+        process.start()
+        self.processes[shard] = process
+        logger.info("Shard %s/%s started (pid %s)" % (shard, self.shard_count, process.pid))
+
+    def start(self) -> None:
+        for shard in range(self.shard_count):
+            self.spawn(shard)
+
+    async def supervise(self, interval: float = 5.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for shard, process in list(self.processes.items()):
+                if process.is_alive():
+                    continue
+                if process.exitcode == 0:
+                    # Nothing assigned to it, or it was asked to stop
+                    del self.processes[shard]
+                    continue
+                if shard not in self.restart_at:
+                    self.restarts[shard] = self.restarts.get(shard, 0) + 1
+                    delay = min(RESTART_BASE * 2 ** (self.restarts[shard] - 1), RESTART_MAX)
+                    self.restart_at[shard] = time.monotonic() + delay
+                    logger.error("Shard %s exited (code %s), restarting in %ss" % (
+                        shard, process.exitcode, delay))
+                elif time.monotonic() >= self.restart_at[shard]:
+                    del self.restart_at[shard]
+                    self.spawn(shard)
+
+    async def drain(self, handle) -> None:
+        while True:
+            try:
+                kind, shard, account, payload = await asyncio.to_thread(self.channel.get, True, 1.0)
+            except queue.Empty:
+                continue
+            try:
+                await handle(kind, account, payload)
+            except Exception as e:
+                logger.exception("ERR_SHARD_MESSAGE: %s [%s/%s] | %s" % (kind, shard, account, e))
+
+    def stop(self, timeout: float = 30.0) -> None:
+        if stopping := self.events.get("stopping"):
+            stopping.set()
+        deadline = time.monotonic() + timeout
+        for process in self.processes.values():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                process.terminate()
+                process.join(5)
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = None
+
+
+class StateStore:
+    """
+    Small key/value store for the bot's runtime state (cookies, chat ids,
+    pending messages, withdrawal receipts) kept in one SQLite file.
+
+    Reads are served from memory. Writes only mark the key dirty, the
+    write-behind flusher (or `flush()`) persists every dirty key in a
+    single transaction, so a crash never leaves a half written file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.values: dict = None
+        self.dirty: set[str] = set()
+        self.lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path.as_posix(), timeout=30)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated REAL NOT NULL
+            )
+        ''')
+        return conn
+
+    def load(self) -> dict:
+        if self.values is None:
+            with self.lock:
+                if self.values is None:
+                    conn = self.connect()
+                    try:
+                        self.values = {
+                            key: json.loads(value)
+                            for key, value in conn.execute("SELECT key, value FROM state")
+                        }
+                    finally:
+                        conn.close()
+        return self.values
+
+    def get(self, key: str, default=None):
+        return self.load().get(key, default)
+
+    def set(self, key: str, value) -> None:
+        values = self.load()
+        with self.lock:
+            if key in values and values[key] == value:
+                return
+            values[key] = value
+            self.dirty.add(key)
+
+    def delete(self, key: str) -> None:
+        values = self.load()
+        with self.lock:
+            if key in values:
+                del values[key]
+                self.dirty.add(key)
+
+    def flush(self) -> int:
+        with self.lock:
+            if not self.dirty:
+                return 0
+            changes = [
+                (key, key in self.values and json.dumps(self.values[key]) or None)
+                for key in self.dirty
+            ]
+            self.dirty.clear()
+
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    now = time.time()
+                    for key, value in changes:
+                        if value is None:
+                            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+                        else:
+                            conn.execute(
+                                "INSERT OR REPLACE INTO state (key, value, updated) VALUES (?, ?, ?)",
+                                (key, value, now)
+                            )
+            finally:
+                conn.close()
+        except Exception:
+            # Keeping the keys dirty, the next flush retries them
+            with self.lock:
+                self.dirty.update(key for key, _ in changes)
+            raise
+        return len(changes)
+
+    async def run_flusher(self, interval: float = 5.0) -> None:
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    if flushed := await asyncio.to_thread(self.flush):
+                        logger.debug("State flushed (%s keys)" % flushed)
+                except Exception as e:
+                    logger.exception("ERR_FLUSH_STATE: %s" % e)
+        finally:
+            self.flush()
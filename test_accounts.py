@@ -0,0 +1,46 @@
+import json
+import unittest
+
+import accounts
+import core
+import main
+import page_cache
+from testing import MockAccountTestCase
+
+
+class Box:
+    def get(self, key: str, default=None):
+        return "%s:%s" % (key, default)
+
+
+class ScopedTest(unittest.TestCase):
+    def test_forwards_get_of_the_instance(self) -> None:
+        boxes = accounts.Scoped("box", lambda account: Box())
+        self.assertEqual(boxes.get("key", 1), "key:1")
+        self.assertIsInstance(boxes.instance(), Box)
+
+
+class ScopedStateTest(MockAccountTestCase):
+    async def test_load_cookies(self) -> None:
+        # The legacy cookies.json is imported into the account's state store
+        self.account.cookies_path.write_text(json.dumps({"pocketpartners_session": "abc"}))
+        self.assertEqual(core.load_cookies(), {"pocketpartners_session": "abc"})
+        self.assertIs(core.store.instance(), self.account.instance("store", core.make_store))
+
+    async def test_withdrawal_receipt_keeps_legacy_one(self) -> None:
+        self.account.withdrawal_message_path.write_text("Old receipt", encoding="utf-8")
+        core.save_withdrawal_receipt("New receipt")
+        self.assertEqual(
+            [receipt["message"] for receipt in core.store.get("withdrawal_receipts")],
+            ["Old receipt", "New receipt"]
+        )
+
+    async def test_get_payment_history(self) -> None:
+        await main.perform_login()
+        page = await main.get_payment_history()
+        self.assertEqual(len(main.extract.history_rows(await page.parsed())), 50)
+        self.assertIsNotNone(page_cache.pages.peek(core.payment_history_link))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import http.cookiejar
+import time
+import unittest
+
+import httpx
+
+import auth
+
+
+def cookie(name: str, expires: float) -> http.cookiejar.Cookie:
+    return http.cookiejar.Cookie(
+        0, name, "value", None, False, "pocketpartners.com", True, False, "/", True,
+        False, int(expires), False, None, None, {}
+    )
+
+
+class CookiesExpiringTest(unittest.TestCase):
+    def test_lapsed_and_other_cookies_are_ignored(self) -> None:
+        cookies = httpx.Cookies()
+        cookies.jar.set_cookie(cookie("laravel_session", time.time() - 100))
+        cookies.jar.set_cookie(cookie("_ga", time.time() + 60))
+        self.assertFalse(auth.cookies_expiring(cookies, within=300))
+
+    def test_session_cookie_running_out(self) -> None:
+        cookies = httpx.Cookies()
+        cookies.jar.set_cookie(cookie("XSRF-TOKEN", time.time() + 60))
+        self.assertTrue(auth.cookies_expiring(cookies, within=300))
+        self.assertFalse(auth.cookies_expiring(cookies, within=30))
+
+
+if __name__ == "__main__":
+    unittest.main()
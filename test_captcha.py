@@ -0,0 +1,33 @@
+import time
+import unittest
+from pathlib import Path
+
+import accounts
+import captcha
+import core
+
+
+class TokenPoolScopeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        # Wired up by main.py otherwise
+        captcha.logger = core.logger
+
+    def test_disarm_keeps_other_accounts_tokens(self) -> None:
+        first, second = [
+            accounts.Account(name, {**core.config, "email": name, "password": name}, Path(name))
+            for name in ("first", "second")
+        ]
+        accounts.activate(first)
+        captcha.tokens.tokens.append(("token", time.monotonic()))
+
+        # The second account logged in
+        accounts.activate(second)
+        captcha.tokens.disarm()
+
+        accounts.activate(first)
+        self.assertEqual(captcha.tokens.take(), "token")
+
+
+if __name__ == "__main__":
+    unittest.main()
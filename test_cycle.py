@@ -0,0 +1,47 @@
+import unittest
+
+import main
+import models
+from testing import MockAccountTestCase
+
+
+class CycleSmokeTest(MockAccountTestCase):
+    """One statistics and one withdrawal cycle against the mock site, like benchmark_cycle.py."""
+
+    async def test_statistics_cycle(self) -> None:
+        results = await main.get_statistics()
+        self.assertIn("Current week", results)
+        self.assertEqual(results["Current week"].current.deposits, float(self.site.figures["sum_depo"]))
+        self.assertTrue(await models.StatisticsLog.filter(account=self.account.name).exists())
+
+    async def test_withdrawal_cycle(self) -> None:
+        # Startup logs every account in before the monitor runs
+        await main.perform_login()
+        await models.toggle_auto_withdrawal("on")
+        await models.update_withdrawal_settings(60, 1)
+        history_obj = await main.load_history()
+        payments = len(self.site.payments)
+
+        await main.withdrawal_cycle(history_obj)
+
+        # The bot's own request went through and is the latest one seen
+        self.assertEqual(len(self.site.payments), payments + 1)
+        self.assertEqual(self.site.payments[0]["amount"], 60)
+        self.assertEqual(str(history_obj.request_id), str(self.site.payments[0]["id"]))
+        self.assertTrue(any(kind == "message" for kind, _, _ in self.outbox.items))
+
+        # The payment request page dropped the cookies, the next cycle logs in again
+        results = await main.get_statistics()
+        self.assertIn("Current week", results)
+
+
+class OtpCycleSmokeTest(CycleSmokeTest):
+    """The same cycles with the 2FA step on every login."""
+
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.site.otp_secret = self.account.google_auth_secret_key
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Regression tests of the history extraction, run with
+`python -m unittest test_extract` (or pytest) from the project folder.
+"""
+import unittest
+from pathlib import Path
+
+import extract
+
+fixtures_path = Path(__file__).parent
+
+
+class HistoryStreamTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.content = fixtures_path.joinpath("withdrawal_request.html").read_bytes()
+        cls.expected = extract.history_rows(extract.parse(cls.content))
+
+    def stream_rows(self, chunk_size: int) -> tuple[list, bool]:
+        stream = extract.HistoryStream()
+        rows = []
+        for start in range(0, len(self.content), chunk_size):
+            rows += stream.feed(self.content[start:start + chunk_size])
+        rows += stream.close()
+        return rows, stream.finished
+
+    def test_chunk_sizes_match_full_parse(self) -> None:
+        self.assertTrue(self.expected)
+        # Network chunks can be any size, the tiny ones used to lose every row
+        for chunk_size in (1, 7, 8, 9, 13, 14, 19, 24, 100, 4096, 16 * 1024, len(self.content)):
+            with self.subTest(chunk_size=chunk_size):
+                rows, finished = self.stream_rows(chunk_size)
+                self.assertTrue(finished)
+                self.assertEqual(rows, self.expected)
+
+    def test_truncated_page_is_not_finished(self) -> None:
+        stream = extract.HistoryStream()
+        stream.feed(self.content[:len(self.content) // 3])
+        stream.close()
+        self.assertFalse(stream.finished)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+import models
+from testing import MockAccountTestCase
+
+
+class WithdrawalSettingsTest(MockAccountTestCase):
+    async def stored(self) -> models.Withdrawal:
+        # Straight from the database, past the cache
+        return await models.Withdrawal.filter(account=self.account.name).first()
+
+    async def test_read(self) -> None:
+        self.assertFalse(await models.is_auto_withdrawal_active())
+        self.assertEqual(await models.get_withdrawal_settings(), (10, 60))
+
+    async def test_toggle(self) -> None:
+        await models.toggle_auto_withdrawal("on")
+        self.assertTrue(await models.is_auto_withdrawal_active())
+        self.assertTrue((await self.stored()).auto)
+
+        await models.toggle_auto_withdrawal("off")
+        self.assertFalse(await models.is_auto_withdrawal_active())
+        self.assertFalse((await self.stored()).auto)
+
+    async def test_update(self) -> None:
+        await models.update_withdrawal_settings(100, 1440)
+        self.assertEqual(await models.get_withdrawal_settings(), (100, 1440))
+        row = await self.stored()
+        self.assertEqual((row.amount, row.period), (100, 1440))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import core
+import main
+import models
+from testing import MockAccountTestCase
+
+
+class UnchangedScrapeTest(MockAccountTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        # No activity between the polls
+        figures = self.site.statistics()
+        self.site.statistics = lambda: figures
+        await main.perform_login()
+
+    async def test_identical_scrapes(self) -> None:
+        first = await main.process_statistics("Current week")
+        second = await main.process_statistics("Current week")
+
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertEqual(second.current, first.current)
+        # The second pass only left a heartbeat behind
+        self.assertEqual(core.store.get("heartbeat:Current week")["unchanged"], 1)
+        self.assertEqual(await models.StatisticsLog.filter(account=self.account.name).count(), 1)
+
+
+class ChangedScrapeTest(MockAccountTestCase):
+    async def asyncSetUp(self) -> None:
+        await super().asyncSetUp()
+        self.figures = self.site.statistics()
+        self.site.statistics = lambda: self.figures
+        await main.perform_login()
+
+    async def test_stored_row_is_updated(self) -> None:
+        await main.process_statistics("Current week")
+        self.figures = {**self.figures, "sum_depo": str(float(self.figures["sum_depo"]) + 100)}
+        second = await main.process_statistics("Current week")
+
+        row = await models.Statistics.get(account=self.account.name, period="Current week")
+        self.assertEqual(row.deposits, second.current.deposits)
+        self.assertEqual(row.old_deposits, second.current.deposits - 100)
+        self.assertEqual(await models.StatisticsLog.filter(account=self.account.name).count(), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Shared setup of the tests: a throwaway account with its own folder and
+database, served by the mock site of mock_server.py instead of the network.
+
+Run the tests from the project folder, core.py reads credentials.env there:
+
+    python -m unittest
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyotp
+
+import accounts
+import captcha
+import core
+import main
+import mock_server
+import models
+import sessions
+from benchmark_cycle import CollectingOutbox
+
+
+class MockAccountTestCase(unittest.IsolatedAsyncioTestCase):
+    """Every test runs as a fresh account, nothing is written outside a temporary folder."""
+
+    site_options: dict = {}
+
+    async def asyncSetUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory(prefix="pocketpartners-test-")
+        self.path = Path(self.tmp.name)
+        self.site = mock_server.MockPocketPartners(seed=1, **self.site_options)
+        self.account = accounts.Account("test", {
+            **core.config,
+            "email": "affiliate@example.com",
+            "password": "mock-password",
+            "google_auth_secret_key": pyotp.random_base32(),
+        }, self.path)
+        self.account.chat_ids_path.write_text("1\n")
+
+        sessions.upstream = self.site.transport()
+        core.captcha_fake_delay = 0.0
+        captcha.solver = captcha.fake_solve
+        main.OUTBOX = self.outbox = CollectingOutbox()
+        models.db_name = self.path.joinpath("test.db").as_posix()
+
+        await main.db_init([self.account])
+        accounts.activate(self.account)
+
+    async def asyncTearDown(self) -> None:
+        await main.statistics_pipeline.stop()
+        await main.alert_pipeline.stop()
+        await sessions.manager.aclose()
+        core.store.flush()
+        await main.db_close()
+        sessions.upstream = None
+        main.OUTBOX = None
+        self.tmp.cleanup()
@@ -15,6 +15,11 @@ _Ping me regarding this if you need previous and change related values as well._
 /autowithdrawal on      Enable the auto-withdrawal option
 /autowithdrawal off     Disable the auto-withdrawal option
 
+(Proxy Related)
+/proxies         Lists the health stats of the configured proxies
+/captures        Exports the recent debug HTML captures (logs/captures)
+/totals          Current week commission of every account and their total
+
 (Compare Related)
 /compareday     Return the formatted message for "Comparison of stats of the current day with the same day in the previous week".
 /comparetime     Return the formatted message for "Comparison of stats of the current hour with the same hour in the previous week".